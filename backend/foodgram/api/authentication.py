@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.metrics import record_cache
+
+TOKEN_KEY = 'auth-token-fields:{}'
+# Поля пользователя, которых достаточно для проверки прав.
+AUTH_FIELDS = ('id', 'is_active', 'is_staff', 'role')
+
+
+class LocalCache:
+    '''
+    LRU-кэш процесса: не больше size записей, каждая живёт
+    ttl секунд.
+    '''
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+
+local_tokens = LocalCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_LOCAL_TTL
+)
+
+
+def token_cache_key(key):
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def forget_tokens(keys):
+    '''
+    Убирает токены из кэшей сразу и ещё раз после фиксации
+    транзакции: запрос, прочитавший пользователя до фиксации,
+    мог успеть положить его обратно.
+    '''
+    cache_keys = [token_cache_key(key) for key in keys]
+    if not cache_keys:
+        return
+
+    def forget():
+        local_tokens.delete_many(cache_keys)
+        cache.delete_many(cache_keys)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+def cached_user(values):
+    '''
+    Пользователь из полей кэша токенов: остальные поля
+    загружаются из БД при обращении к ним.
+    '''
+    model = get_user_model()
+    names = [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        router.db_for_read(model), names, [values[name] for name in names]
+    )
+
+
+def load_profile(user):
+    '''
+    Догружает одним запросом поля, отложенные у пользователя
+    из кэша токенов, и возвращает пользователя.
+    '''
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication без запроса к БД на каждое чтение API.
+    По токену кэшируются только поля AUTH_FIELDS: в памяти
+    процесса на TOKEN_CACHE_LOCAL_TTL секунд и в общем кэше
+    на TOKEN_CACHE_TTL секунд. Запросы на чтение получают
+    пользователя с отложенной загрузкой остальных полей,
+    запросы на изменение — пользователя из БД. Выход,
+    удаление токена и изменение пользователя убирают
+    его из кэшей.
+    '''
+
+    def authenticate(self, request):
+        self.safe = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        values = None
+        if self.safe:
+            values = local_tokens.get(cache_key)
+            if values is None:
+                values = cache.get(cache_key)
+                if values is not None:
+                    local_tokens.set(cache_key, values)
+            record_cache('auth-token', values is not None)
+        if values is None:
+            user = super().authenticate_credentials(key)[0]
+            values = {field: getattr(user, field) for field in AUTH_FIELDS}
+            cache.set(cache_key, values, settings.TOKEN_CACHE_TTL)
+            local_tokens.set(cache_key, values)
+        else:
+            user = cached_user(values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,46 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    '''
+    Предупреждает о кэшах в памяти процесса: версии каталогов,
+    ETag и кэш токенов у каждого процесса gunicorn будут свои,
+    и изменения в одном процессе не сбросят кэши других.
+    '''
+    if settings.DEBUG:
+        return []
+    return [
+        Warning(
+            f'Кэш {alias!r} хранится в памяти процесса.',
+            hint='Укажите общий для процессов бэкенд, например Redis '
+                 '(REDIS_URL, CACHE_BACKEND, RESPONSE_CACHE_BACKEND).',
+            id='api.W001',
+        )
+        for alias, options in settings.CACHES.items()
+        if options['BACKEND'] == LOCMEM_BACKEND
+    ]
+
+
+@register()
+def check_pdf_font(app_configs, **kwargs):
+    '''
+    Без шрифта с кириллицей выгрузка списка покупок в PDF
+    завершается ошибкой, о чём лучше узнать при запуске.
+    '''
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if font_path and os.path.exists(font_path):
+        return []
+    return [
+        Warning(
+            f'Шрифт для PDF {font_path!r} не найден.',
+            hint='Установите fonts-dejavu-core или укажите путь '
+                 'к TTF-шрифту с кириллицей в SHOPPING_LIST_PDF_FONT.',
+            id='api.W002',
+        )
+    ]
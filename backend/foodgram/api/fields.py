@@ -1,7 +1,14 @@
 import base64
+from collections import Counter
 
 from django.core.files.base import ContentFile
-from rest_framework.serializers import ImageField
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+from rest_framework.serializers import (
+    Field,
+    ImageField,
+    PrimaryKeyRelatedField,
+    ValidationError
+)
 
 
 class Base64ImageField(ImageField):
@@ -12,3 +19,83 @@ class Base64ImageField(ImageField):
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+class ImageVariantField(Field):
+    '''
+    Адрес уменьшенной копии изображения рецепта.
+    Вариант можно переопределить через контекст сериализатора
+    ключом image_variant.
+    '''
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        variant = self.context.get('image_variant', self.variant)
+        url = recipe.image_variant_url(variant)
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+def resolve_ids(queryset, ids):
+    '''
+    Загружает объекты по списку id одним запросом in_bulk.
+    Сообщает сразу обо всех повторах и обо всех ненайденных id.
+    '''
+    duplicates = sorted(pk for pk, count in Counter(ids).items() if count > 1)
+    if duplicates:
+        raise ValidationError(
+            f'Повторяющиеся id: {", ".join(map(str, duplicates))}.'
+        )
+    objects = queryset.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in objects]
+    if missing:
+        raise ValidationError(
+            f'Не найдены объекты с id: {", ".join(map(str, missing))}.'
+        )
+    return objects
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    '''
+    Список первичных ключей, который проверяется одним запросом
+    вместо запроса на каждый элемент.
+    '''
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        ids = [self.child_relation.to_pk(item) for item in data]
+        objects = resolve_ids(self.child_relation.get_queryset(), ids)
+        return [objects[pk] for pk in ids]
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    '''
+    PrimaryKeyRelatedField, который при many=True
+    проверяет все значения одним запросом.
+    '''
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            pk = None
+        if pk is None or isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return pk
@@ -3,17 +3,8 @@ from django_filters.rest_framework import (
     BooleanFilter,
     FilterSet
 )
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Ingredient, Recipe
-
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+from recipes.models import Recipe
 
 
 class RecipeFilterSet(FilterSet):
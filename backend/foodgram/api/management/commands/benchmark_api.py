@@ -0,0 +1,354 @@
+import gc
+import json
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+PNG_IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+METRICS = ('p50_ms', 'p95_ms', 'queries', 'memory_kb')
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+# Допустимый относительный рост метрик над эталоном и абсолютный
+# запас, чтобы шум на быстрых эндпоинтах не считался регрессией.
+# Число запросов расти не должно.
+DEFAULT_TOLERANCE = {'p50_ms': 0.5, 'p95_ms': 2.0, 'memory_kb': 0.25}
+DEFAULT_SLACK = {'p50_ms': 5, 'p95_ms': 10, 'memory_kb': 64}
+# Эндпоинты, которые замеряются без кэша ответов.
+UNCACHED_ENDPOINTS = {'recipes-list-uncached'}
+UNCACHED_ALIAS = 'benchmark-uncached'
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк эндпоинтов API на заполненной БД.
+    Запуск производится командой
+    python manage.py benchmark_api [--output report.json] [--compare]
+    Для заполнения БД используйте seed_load_data.
+    Каждый запрос выполняется в транзакции, которая откатывается,
+    поэтому запись рецептов не меняет данные.
+    """
+    help = 'Замеряет задержку, число запросов к БД и память эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--output', help='Путь для сохранения JSON-отчёта.'
+        )
+        parser.add_argument(
+            '--baseline', default=str(DEFAULT_BASELINE),
+            help='JSON с эталоном и бюджетами эндпоинтов.',
+        )
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Сравнить результат с эталоном и упасть при регрессии.',
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Сохранить результат как новый эталон.',
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Запустить только перечисленные эндпоинты.',
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = APIClient()
+        endpoints = [
+            endpoint for endpoint in self.get_endpoints(user)
+            if not options['only'] or endpoint[0] in options['only']
+        ]
+        results = {}
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                for name, authenticated, method, path, data in endpoints:
+                    request_client = client if authenticated else anonymous
+                    with self.response_cache(name):
+                        results[name] = self.run_endpoint(
+                            request_client, method, path, data, options
+                        )
+                    self.write_result(name, results[name])
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'iterations': options['iterations'],
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            self.save(options['output'], report)
+        if options['save_baseline']:
+            self.save_baseline(options['baseline'], report)
+        if options['compare']:
+            self.compare(report, options['baseline'])
+
+    def response_cache(self, name):
+        '''
+        Для эндпоинтов из UNCACHED_ENDPOINTS подменяет кэш ответов
+        пустым, чтобы замерить построение ответа, а не попадание в кэш.
+        '''
+        if name not in UNCACHED_ENDPOINTS:
+            return nullcontext()
+        return override_settings(
+            CACHES={
+                **settings.CACHES,
+                UNCACHED_ALIAS: {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+                },
+            },
+            RESPONSE_CACHE_ALIAS=UNCACHED_ALIAS,
+        )
+
+    def get_user(self):
+        user = User.objects.annotate(
+            subscriptions=Count('subscriber', distinct=True),
+            cart=Count('shopping_cart', distinct=True),
+        ).filter(cart__gt=0, recipes__isnull=False).order_by(
+            '-subscriptions'
+        ).first()
+        if user is None:
+            raise CommandError(
+                'Нужен пользователь с рецептами и корзиной, '
+                'заполните БД командой seed_load_data.'
+            )
+        return user
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        own_recipe = user.recipes.order_by('-pub_date', '-id').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        middle_page = max(1, Recipe.objects.count() // 6 // 2)
+        payload = {
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.order_by('id').values_list(
+                    'id', flat=True
+                )[:8]
+            ],
+            'tags': [tag.id],
+            'image': PNG_IMAGE,
+            'name': 'Рецепт для бенчмарка',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+        return [
+            ('recipes-list', False, 'get', '/api/recipes/', None),
+            ('recipes-list-uncached', False, 'get', '/api/recipes/', None),
+            ('recipes-list-auth', True, 'get', '/api/recipes/', None),
+            ('recipes-list-tags', True, 'get',
+             f'/api/recipes/?tags={tag.slug}', None),
+            ('recipes-list-author', True, 'get',
+             f'/api/recipes/?author={recipe.author_id}', None),
+            ('recipes-list-favorited', True, 'get',
+             '/api/recipes/?is_favorited=1', None),
+            ('recipes-list-in-cart', True, 'get',
+             '/api/recipes/?is_in_shopping_cart=1', None),
+            ('recipes-list-deep-page', True, 'get',
+             f'/api/recipes/?page={middle_page}', None),
+            ('recipes-list-cursor', True, 'get',
+             '/api/recipes/?cursor=', None),
+            ('recipes-detail', True, 'get',
+             f'/api/recipes/{recipe.id}/', None),
+            ('recipes-feed', True, 'get', '/api/recipes/feed/', None),
+            ('recipes-pantry', False, 'get',
+             '/api/recipes/pantry/?' + '&'.join(
+                 f'ingredients={item["id"]}'
+                 for item in payload['ingredients'][:5]
+             ), None),
+            ('users-subscriptions', True, 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None),
+            ('ingredients-search', False, 'get',
+             f'/api/ingredients/?name={ingredient.name[:3]}', None),
+            ('recipes-download-shopping-cart', True, 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('recipes-download-shopping-cart-csv', True, 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', None),
+            ('recipes-create', True, 'post', '/api/recipes/', payload),
+            ('recipes-update', True, 'patch',
+             f'/api/recipes/{own_recipe.id}/', payload),
+        ]
+
+    def request(self, client, method, path, data, queries=None):
+        with transaction.atomic():
+            with queries if queries is not None else nullcontext():
+                response = getattr(client, method)(
+                    path, data, format='json'
+                )
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {path}: {response.status_code}'
+            )
+        return response
+
+    def run_endpoint(self, client, method, path, data, options):
+        for _ in range(options['warmup']):
+            self.request(client, method, path, data)
+        timings = []
+        # Как timeit, замеры идут без сборщика мусора: его паузы
+        # попадают в случайные итерации и делают p95 нестабильным.
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                self.request(client, method, path, data)
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            gc.enable()
+        queries = CaptureQueriesContext(connection)
+        tracemalloc.start()
+        self.request(client, method, path, data, queries)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': len(queries.captured_queries),
+            'memory_kb': round(peak / 1024, 1),
+        }
+
+    def write_result(self, name, result):
+        self.stdout.write(
+            f'{name:<40}'
+            f'p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'запросов {result["queries"]:>3}  '
+            f'память {result["memory_kb"]:>9.1f} КБ'
+        )
+
+    def save(self, path, report):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(report, ensure_ascii=False, indent=2) + '\n',
+            encoding='utf-8',
+        )
+        self.stdout.write(f'Отчёт сохранён в {path}')
+
+    def load_baseline(self, path):
+        try:
+            return json.loads(Path(path).read_text('utf-8'))
+        except FileNotFoundError:
+            raise CommandError(f'Эталон {path} не найден.')
+
+    def save_baseline(self, path, report):
+        '''
+        Сохраняет отчёт как эталон, оставляя допуски и бюджеты
+        эндпоинтов из прежнего эталона.
+        '''
+        baseline = {
+            'meta': report['meta'],
+            'tolerance': DEFAULT_TOLERANCE,
+            'slack': DEFAULT_SLACK,
+            'endpoints': {},
+        }
+        if Path(path).exists():
+            previous = self.load_baseline(path)
+            for key in ('tolerance', 'slack'):
+                baseline[key] = previous.get(key, baseline[key])
+        else:
+            previous = {'endpoints': {}}
+        for name, result in report['endpoints'].items():
+            endpoint = dict(result)
+            for key in ('tolerance', 'budget'):
+                value = previous['endpoints'].get(name, {}).get(key)
+                if value is not None:
+                    endpoint[key] = value
+            baseline['endpoints'][name] = endpoint
+        self.save(path, baseline)
+
+    def get_limit(self, metric, expected, tolerance, slack):
+        '''
+        Наибольшее допустимое значение метрики: бюджет эндпоинта,
+        а без него — эталон с допуском и абсолютным запасом.
+        '''
+        budget = expected.get('budget', {}).get(metric)
+        if budget is not None:
+            return budget
+        value = expected.get(metric)
+        if value is None or metric == 'queries':
+            return value
+        return max(
+            value * (1 + tolerance.get(metric, 0)),
+            value + slack.get(metric, 0),
+        )
+
+    def compare(self, report, baseline_path):
+        '''
+        Сравнивает отчёт с эталоном. Число запросов не должно расти,
+        а задержка и пиковая память — превышать эталон больше чем
+        на допуск. Допуск эндпоинта заменяет общий, а бюджет —
+        значение из эталона. Задержка сравнивается, только если
+        эталон снят на той же СУБД.
+        '''
+        baseline = self.load_baseline(baseline_path)
+        tolerance = baseline.get('tolerance', DEFAULT_TOLERANCE)
+        if not isinstance(tolerance, dict):
+            tolerance = dict.fromkeys(METRICS, tolerance)
+        slack = baseline.get('slack', DEFAULT_SLACK)
+        metrics = METRICS
+        database = baseline.get('meta', {}).get('database')
+        if database not in (None, report['meta']['database']):
+            metrics = tuple(
+                metric for metric in METRICS
+                if metric not in LATENCY_METRICS
+            )
+            self.stdout.write(self.style.WARNING(
+                f'Эталон снят на {database}, задержка не сравнивается.'
+            ))
+        regressions = []
+        for name, result in report['endpoints'].items():
+            expected = baseline['endpoints'].get(name)
+            if expected is None:
+                continue
+            endpoint_tolerance = {
+                **tolerance, **expected.get('tolerance', {})
+            }
+            for metric in metrics:
+                limit = self.get_limit(
+                    metric, expected, endpoint_tolerance, slack
+                )
+                if limit is not None and result[metric] > limit:
+                    regressions.append(
+                        f'{name}: {metric} {result[metric]} > {limit:g}'
+                    )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,143 @@
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import shopping_list
+from api.views import RecipeViewSet
+from recipes.models import (
+    Ingredient,
+    IngredientAmountInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+from users.models import User
+
+BENCHMARK_PREFIX = 'benchmark-shopping-cart'
+
+
+class Command(BaseCommand):
+    """
+    Сравнение выгрузки списка покупок целиком в памяти и потоком.
+    Запуск производится командой
+    python manage.py benchmark_shopping_cart [--recipes 500]
+    Тестовые данные создаются в транзакции и откатываются по завершении.
+    """
+    help = 'Замеряет пиковую память и время до первого байта выгрузки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.create_cart(
+                options['recipes'],
+                options['ingredients'],
+                options['per_recipe'],
+            )
+            self.stdout.write(
+                f'Корзина: {options["recipes"]} рецептов, '
+                f'{options["per_recipe"]} ингредиентов в каждом.'
+            )
+            self.stdout.write(
+                f'{"вариант":<10}{"TTFB, мс":>12}'
+                f'{"всего, мс":>12}{"пик памяти, КБ":>18}'
+            )
+            for name, fetch in self.variants(user):
+                results = [self.measure(fetch) for _ in range(options['runs'])]
+                ttfb, total, peak = (min(values) for values in zip(*results))
+                self.stdout.write(
+                    f'{name:<10}{ttfb * 1000:>12.1f}'
+                    f'{total * 1000:>12.1f}{peak / 1024:>18.1f}'
+                )
+            transaction.set_rollback(True)
+
+    def create_cart(self, recipes_count, ingredients_count, per_recipe):
+        user = User.objects.create(
+            username=BENCHMARK_PREFIX,
+            email=f'{BENCHMARK_PREFIX}@example.com',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'{BENCHMARK_PREFIX}-{number}',
+                measurement_unit='г',
+            ) for number in range(ingredients_count)
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith=BENCHMARK_PREFIX
+        ).order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user,
+                name=f'{BENCHMARK_PREFIX}-{number}',
+                image='recipes/images/temp.png',
+                text=BENCHMARK_PREFIX,
+                cooking_time=1,
+            ) for number in range(recipes_count)
+        )
+        recipes = list(Recipe.objects.filter(author=user).order_by('id'))
+        IngredientAmountInRecipe.objects.bulk_create(
+            IngredientAmountInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[
+                    (number * per_recipe + offset) % ingredients_count
+                ],
+                amount=offset + 1,
+            )
+            for number, recipe in enumerate(recipes)
+            for offset in range(per_recipe)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe) for recipe in recipes
+        )
+        ShoppingListItem.objects.add_recipes(
+            user.id, [recipe.id for recipe in recipes]
+        )
+        return user
+
+    def variants(self, user):
+        view = RecipeViewSet.as_view(
+            {'get': 'download_shopping_cart'},
+            **RecipeViewSet.download_shopping_cart.kwargs,
+        )
+        factory = APIRequestFactory()
+
+        def fetch_format(file_format):
+            def fetch():
+                request = factory.get('/', {'format': file_format})
+                force_authenticate(request, user=user)
+                return view(request)
+            return fetch
+
+        def fetch_buffered():
+            ingredients = shopping_list.get_ingredients(user)
+            content = ''.join(shopping_list.iter_text(user, ingredients))
+            return HttpResponse(content, content_type='text/plain')
+
+        yield 'buffered', fetch_buffered
+        for file_format in ('txt', 'csv', 'pdf'):
+            yield file_format, fetch_format(file_format)
+
+    def measure(self, fetch):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = fetch()
+        chunks = iter(
+            response.streaming_content if response.streaming
+            else [response.content]
+        )
+        next(chunks, b'')
+        ttfb = time.perf_counter() - started
+        for _ in chunks:
+            pass
+        total = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return ttfb, total, peak
@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.response import Response
+
+from foodgram.metrics import record_cache
+from foodgram.performance import serializer_timer
+from recipes.versions import get_response_versions, response_cache
+
+
+class ConditionalGetMixin:
+    '''
+    Ответ 304 на If-None-Match и If-Modified-Since до сериализации.
+    Вьюсет задаёт валидаторы в get_list_validators и
+    get_object_validators: пару (ETag, время изменения) или None.
+    '''
+    vary_on_authorization = False
+
+    def get_list_validators(self, request):
+        return None
+
+    def get_object_validators(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_list_validators(request),
+            super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_object_validators(request),
+            super().retrieve, *args, **kwargs
+        )
+
+    def conditional_response(self, request, validators, view, *args,
+                             **kwargs):
+        if validators is None:
+            return view(request, *args, **kwargs)
+        etag, last_modified = validators
+        etag = quote_etag(etag)
+        last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        record_cache('conditional-get', response is not None)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if self.vary_on_authorization:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class TimedRepresentationMixin:
+    '''
+    Учитывает время to_representation в замерах PerformanceMiddleware.
+    '''
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class AnonymousResponseCacheMixin:
+    '''
+    Кэширует данные ответов list и retrieve для анонимных запросов.
+    Ключ строится из нормализованных параметров cache_query_params
+    и токенов версий из get_cache_versions: после смены любой
+    из версий закэшированный ответ больше не находится.
+    '''
+    cache_query_params = ()
+
+    def get_cache_versions(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def cached_response(self, request, view, *args, **kwargs):
+        names = None
+        if not request.user.is_authenticated:
+            names = self.get_cache_versions(request)
+        if names is None:
+            return view(request, *args, **kwargs)
+        cache = response_cache()
+        key = self.get_cache_key(request, get_response_versions(names))
+        data = cache.get(key)
+        record_cache('responses', data is not None)
+        if data is not None:
+            return Response(data)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        return response
+
+    def get_cache_key(self, request, versions):
+        '''
+        Параметры без учёта порядка, повторов и пустых значений,
+        посторонние параметры отбрасываются. Хост входит в ключ,
+        потому что ссылки на картинки абсолютные.
+        '''
+        params = sorted({
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name in self.cache_query_params
+            for value in values if value
+        })
+        source = json.dumps([
+            self.basename, self.action, self.kwargs, request.get_host(),
+            params, versions,
+        ], sort_keys=True)
+        return 'response:' + hashlib.md5(source.encode()).hexdigest()
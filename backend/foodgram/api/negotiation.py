@@ -0,0 +1,22 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+    '''
+    Выбирает рендерер только по параметру ?format=, заголовок Accept
+    не учитывается. Без параметра или с неизвестным форматом
+    выбирается первый рендерер представления.
+    '''
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        renderer = next(
+            (
+                renderer for renderer in renderers
+                if renderer.format == format
+            ),
+            renderers[0],
+        )
+        return renderer, renderer.media_type
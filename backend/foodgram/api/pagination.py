@@ -1,6 +1,117 @@
+import base64
+import binascii
+import json
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.feed import feed_keys, order_after
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    '''
+    Постраничная разбивка рецептов.
+    По умолчанию работает по номерам страниц, а при наличии параметра
+    cursor переходит на курсор по (-pub_date, -id): страница
+    выбирается условием по ключу вместо OFFSET и без подсчёта COUNT(*).
+    '''
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param)
+        )
+        results = self.get_cursor_results(
+            queryset, position, reverse, page_size + 1
+        )
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.page_results = results
+        return results
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def get_cursor_results(self, queryset, position, reverse, count):
+        '''
+        Первые count рецептов после курсора в порядке обхода.
+        '''
+        return list(order_after(queryset, position, reverse)[:count])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_cursor_link(self.has_next, -1, False),
+            'previous': self.get_cursor_link(self.has_previous, 0, True),
+            'results': data,
+        })
+
+    def get_cursor_link(self, exists, index, reverse):
+        if not exists or not self.page_results:
+            return None
+        recipe = self.page_results[index]
+        return replace_query_param(
+            remove_query_param(self.base_url, self.page_query_param),
+            self.cursor_query_param,
+            self.encode_cursor(recipe.pub_date, recipe.id, reverse),
+        )
+
+    def encode_cursor(self, pub_date, pk, reverse):
+        payload = json.dumps({
+            'd': pub_date.isoformat(),
+            'i': pk,
+            'r': int(reverse),
+        })
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            pub_date = parse_datetime(payload['d'])
+            pk = int(payload['i'])
+            reverse = bool(payload['r'])
+        except (
+            binascii.Error, ValueError, KeyError, TypeError, UnicodeError
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (pub_date, pk), reverse
+
+
+class FeedPagination(RecipePagination):
+    '''
+    Лента подписок: всегда по курсору, ключи страницы
+    берутся из ленты пользователя.
+    '''
+
+    def use_cursor(self, request):
+        return True
+
+    def get_cursor_results(self, queryset, position, reverse, count):
+        keys = feed_keys(self.request.user.id, position, reverse, count)
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        return [recipes[pk] for _, pk in keys if pk in recipes]
@@ -1,3 +1,6 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -6,3 +9,23 @@ class IsAuthorOrAdminOrReadOnly(permissions.BasePermission):
         return (request.method in permissions.SAFE_METHODS
                 or obj.author == request.user
                 or request.user.is_admin)
+
+
+class IsAdminOrInternalIP(permissions.BasePermission):
+    '''
+    Доступ администраторам и запросам из адресов METRICS_ALLOWED_IPS.
+    '''
+    networks = [
+        ip_network(network.strip(), strict=False)
+        for network in settings.METRICS_ALLOWED_IPS if network.strip()
+    ]
+
+    def has_permission(self, request, view):
+        user = request.user
+        if user.is_authenticated and (user.is_staff or user.is_admin):
+            return True
+        try:
+            address = ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
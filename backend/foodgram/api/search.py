@@ -0,0 +1,127 @@
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock
+
+from foodgram.metrics import record_cache
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+FUZZY_MIN_LENGTH = 3
+FUZZY_THRESHOLD = 0.3
+FUZZY_LIMIT = 10
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientIndex:
+    '''
+    Поисковый индекс ингредиентов в памяти процесса.
+    Строится при первом обращении и перестраивается после изменения
+    каталога ингредиентов. Сначала выдаются совпадения по префиксу,
+    затем по подстроке, затем похожие по триграммам названия.
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.ingredients = []
+        self.names = []
+        self.trigrams = []
+        self.postings = {}
+
+    def build(self):
+        ingredients = [
+            Ingredient(id=pk, name=name, measurement_unit=unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        ]
+        ingredients.sort(key=lambda ingredient: (
+            normalize(ingredient.name), ingredient.measurement_unit
+        ))
+        names = [normalize(ingredient.name) for ingredient in ingredients]
+        grams = [trigrams(name) for name in names]
+        postings = {}
+        for position, name_grams in enumerate(grams):
+            for gram in name_grams:
+                postings.setdefault(gram, []).append(position)
+        self.ingredients, self.names = ingredients, names
+        self.trigrams, self.postings = grams, postings
+
+    def ensure_fresh(self):
+        version = get_version('ingredients')[0]
+        record_cache('ingredient-index', version == self.version)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.build()
+                self.version = version
+
+    def all(self):
+        self.ensure_fresh()
+        return list(self.ingredients)
+
+    def search(self, query):
+        self.ensure_fresh()
+        query = normalize(query)
+        if not query:
+            return list(self.ingredients)
+        names = self.names
+        start = bisect_left(names, query)
+        end = start
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        found = set(range(start, end))
+        substring = [
+            position for position in self.substring_candidates(query)
+            if query in names[position] and position not in found
+        ]
+        found.update(substring)
+        fuzzy = self.fuzzy_search(query, found)
+        return [
+            self.ingredients[position]
+            for position in (*range(start, end), *substring, *fuzzy)
+        ]
+
+    def substring_candidates(self, query):
+        '''
+        Названия, содержащие все триграммы запроса, в алфавитном порядке.
+        '''
+        if len(query) < 3:
+            return range(len(self.names))
+        postings = sorted(
+            (self.postings.get(query[i:i + 3], ())
+             for i in range(len(query) - 2)),
+            key=len,
+        )
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return sorted(candidates)
+
+    def fuzzy_search(self, query, exclude):
+        if len(query) < FUZZY_MIN_LENGTH:
+            return []
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = []
+        for position, common in shared.items():
+            if position in exclude:
+                continue
+            similarity = common / (
+                len(query_grams) + len(self.trigrams[position]) - common
+            )
+            if similarity >= FUZZY_THRESHOLD:
+                scored.append((-similarity, position))
+        scored.sort()
+        return [position for _, position in scored[:FUZZY_LIMIT]]
+
+
+ingredient_index = IngredientIndex()
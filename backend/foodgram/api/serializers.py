@@ -1,21 +1,44 @@
 from django.db.transaction import atomic
-from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework.serializers import (
+    FloatField,
     IntegerField,
+    ListField,
+    ListSerializer,
     ModelSerializer,
     PrimaryKeyRelatedField,
+    Serializer,
     SerializerMethodField,
     SlugRelatedField,
     ValidationError
 )
 
 from recipes import models
-from users.models import Subscribe, User
-from .fields import Base64ImageField
+from recipes.links import delete_rows
+from recipes.memberships import Memberships, get_memberships
+from users.models import User
+from .fields import (
+    Base64ImageField,
+    BulkPrimaryKeyRelatedField,
+    ImageVariantField,
+    resolve_ids
+)
+from .mixins import TimedRepresentationMixin
 
 
-class CustomUserSerializer(UserSerializer):
+def request_memberships(request):
+    '''
+    Избранное, корзина и подписки пользователя запроса.
+    Загружаются один раз на запрос, у анонима пусты.
+    '''
+    if request is None or request.user.is_anonymous:
+        return Memberships()
+    if not hasattr(request, 'memberships'):
+        request.memberships = get_memberships(request.user.id)
+    return request.memberships
+
+
+class CustomUserSerializer(TimedRepresentationMixin, UserSerializer):
     '''
     Сериализатор объектов типа кастомный пользователь.
     '''
@@ -33,10 +56,8 @@ class CustomUserSerializer(UserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return False if not request or request.user.is_anonymous else \
-            Subscribe.objects.filter(
-                subscriber=request.user, author=obj).exists()
+        memberships = request_memberships(self.context.get('request'))
+        return obj.id in memberships.subscriptions
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -62,28 +83,11 @@ class UserCreateSerializer(UserCreateSerializer):
         return value
 
 
-class SubscriptionSerializer(ModelSerializer):
-    '''
-    Сериализатор объектов модели подписок.
-    '''
-    class Meta:
-        model = Subscribe
-        fields = ('subscriber', 'author')
-
-    def validate(self, data):
-        get_object_or_404(User, username=data['author'])
-        if self.context['request'].user == data['author']:
-            raise ValidationError({
-                'errors': 'Подписка на себя запрещена.',
-            })
-        return data
-
-
-class SubscriptionShowSerializer(ModelSerializer):
+class SubscriptionShowSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор отображения подписок.
     '''
-    recipes_count = SerializerMethodField()
+    recipes_count = IntegerField(read_only=True)
     recipes = SerializerMethodField()
     is_subscribed = SerializerMethodField(read_only=True)
 
@@ -100,30 +104,25 @@ class SubscriptionShowSerializer(ModelSerializer):
             'recipes_count',
         )
 
-    def get_recipes_count(self, author):
-        return models.Recipe.objects.filter(author=author).count()
-
     def get_recipes(self, author):
+        '''
+        Рецепты автора заранее загружает и ограничивает по
+        recipes_limit вьюсет подписок (attach_recipes).
+        '''
         queryset = self.context.get('request')
-        recipes_limit = queryset.query_params.get('recipes_limit')
-        recipes = models.Recipe.objects.filter(author=author)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
         serialiser = RecipeShortSerializer(
-            recipes,
+            author.page_recipes,
             many=True,
             context={'request': queryset}
         )
         return serialiser.data
 
     def get_is_subscribed(self, author):
-        return Subscribe.objects.filter(
-            subscriber=self.context.get('request').user,
-            author=author
-        ).exists()
+        memberships = request_memberships(self.context.get('request'))
+        return author.id in memberships.subscriptions
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор объектов типа Тег.
     '''
@@ -137,7 +136,7 @@ class TagSerializer(ModelSerializer):
         )
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор объектов типа Ингредиент.
     '''
@@ -150,11 +149,11 @@ class IngredientSerializer(ModelSerializer):
         )
 
 
-class RecipeShortSerializer(ModelSerializer):
+class RecipeShortSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор для получения информации о рецепте.
     '''
-    image = Base64ImageField()
+    image = ImageVariantField('thumbnail')
 
     class Meta:
         model = models.Recipe
@@ -166,6 +165,37 @@ class RecipeShortSerializer(ModelSerializer):
         )
 
 
+class PantryRecipeSerializer(RecipeShortSerializer):
+    '''
+    Рецепт в поиске по продуктам: найденные и недостающие
+    ингредиенты и доля покрытия.
+    '''
+    matched = IntegerField(read_only=True)
+    missing = IntegerField(read_only=True)
+    coverage = FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (
+            *RecipeShortSerializer.Meta.fields,
+            'matched',
+            'missing',
+            'coverage',
+        )
+
+
+class PantrySerializer(Serializer):
+    '''
+    Параметры поиска по продуктам: id имеющихся ингредиентов
+    и сколько ингредиентов рецепта может не хватать.
+    '''
+    ingredients = ListField(
+        child=IntegerField(min_value=1),
+        min_length=1,
+        max_length=100,
+    )
+    max_missing = IntegerField(min_value=0, required=False)
+
+
 class RecipeIngredientsSerializer(ModelSerializer):
     '''
     Сериализатор для получение информации об ингредиентах в рецепте.
@@ -195,7 +225,7 @@ class RecipeIngredientsSerializer(ModelSerializer):
         )
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор объектов типа Рецепт.
     '''
@@ -208,6 +238,7 @@ class RecipeSerializer(ModelSerializer):
     )
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
+    image = ImageVariantField('card')
 
     class Meta:
         model = models.Recipe
@@ -225,26 +256,35 @@ class RecipeSerializer(ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return False if request.user.is_anonymous else \
-            models.Favourite.objects.filter(
-                user=request.user, recipe__id=obj.id).exists()
+        memberships = request_memberships(self.context.get('request'))
+        return obj.id in memberships.favourites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return False if request.user.is_anonymous else \
-            models.ShoppingCart.objects.filter(
-                user=request.user, recipe__id=obj.id).exists()
+        memberships = request_memberships(self.context.get('request'))
+        return obj.id in memberships.cart
+
+
+class CreateIngredientRecipeListSerializer(ListSerializer):
+    '''
+    Список ингредиентов рецепта: все id проверяются одним запросом.
+    '''
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        ingredients = resolve_ids(
+            models.Ingredient.objects.all(),
+            [item['ingredient'] for item in data],
+        )
+        for item in data:
+            item['ingredient'] = ingredients[item['ingredient']]
+        return data
 
 
 class CreateIngredientRecipeSerializer(ModelSerializer):
     '''
     Сериализатор для добавления ингредиента в рецепт.
     '''
-    id = PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=models.Ingredient.objects.all()
-    )
+    id = IntegerField(source='ingredient')
 
     class Meta:
         model = models.IngredientAmountInRecipe
@@ -252,6 +292,7 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
             'id',
             'amount',
         )
+        list_serializer_class = CreateIngredientRecipeListSerializer
 
     def validate_amount(self, data):
         if int(data) < 1:
@@ -264,14 +305,14 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
         return data
 
 
-class RecipeCreateSerializer(ModelSerializer):
+class RecipeCreateSerializer(TimedRepresentationMixin, ModelSerializer):
     '''
     Сериализатор для создания или обновления рецепта.
     '''
     image = Base64ImageField(use_url=True, max_length=None)
     author = CustomUserSerializer(read_only=True)
     ingredients = CreateIngredientRecipeSerializer(many=True)
-    tags = PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=models.Tag.objects.all(), many=True
     )
     cooking_time = IntegerField()
@@ -300,16 +341,7 @@ class RecipeCreateSerializer(ModelSerializer):
         return recipe
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise ValidationError(
-                    'Есть задублированные ингредиенты!'
-                )
-            ingredients_list.append(ingredient_id)
-        if data['cooking_time'] < 1:
+        if data.get('cooking_time', 1) < 1:
             raise ValidationError(
                 'Время приготовления должно быть больше 0!'
             )
@@ -322,18 +354,72 @@ class RecipeCreateSerializer(ModelSerializer):
         tags = validated_data.pop('tags')
         recipe = models.Recipe.objects.create(
             author=user,
+            ingredients_count=len(ingredients),
             **validated_data
         )
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
         return recipe
 
+    def update_ingredients(self, recipe, rows, ingredients):
+        '''
+        Приводит ингредиенты рецепта к новому списку, записывая
+        только изменения: новые строки, новые количества и удалённые
+        ингредиенты. rows — текущие строки по id ингредиента.
+        '''
+        rows = dict(rows)
+        created, changed = [], []
+        for ingredient in ingredients:
+            row = rows.pop(ingredient['ingredient'].id, None)
+            if row is None:
+                created.append(ingredient)
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                changed.append(row)
+        if rows:
+            removed = models.IngredientAmountInRecipe.objects.filter(
+                pk__in=[row.pk for row in rows.values()]
+            )
+            # Удаление без сигналов: кэш ответов сбрасывает
+            # сохранение самого рецепта.
+            delete_rows(removed)
+        if changed:
+            models.IngredientAmountInRecipe.objects.bulk_update(
+                changed, ['amount']
+            )
+        if created:
+            self.create_ingredients(recipe, created)
+        if created or rows:
+            # Счётчик и флаг не пишутся полным сохранением рецепта.
+            recipe.similarity_stale = True
+            recipe.ingredients_count = len(ingredients)
+            models.Recipe.objects.filter(pk=recipe.pk).update(
+                ingredients_count=recipe.ingredients_count,
+                similarity_stale=True,
+            )
+
     @atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('ingredients', None)
         recipe = instance
-        models.IngredientAmountInRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(recipe, ingredients)
+        if ingredients is not None:
+            rows = {
+                row.ingredient_id: row
+                for row in recipe.ingredient_list.all()
+            }
+            old_amounts = {
+                ingredient_id: row.amount
+                for ingredient_id, row in rows.items()
+            }
+            self.update_ingredients(recipe, rows, ingredients)
+            models.ShoppingListItem.objects.change_recipe(
+                recipe,
+                old_amounts,
+                {
+                    ingredient['ingredient'].id: ingredient['amount']
+                    for ingredient in ingredients
+                },
+            )
         return super().update(recipe, validated_data)
 
     def to_representation(self, instance):
@@ -341,5 +427,22 @@ class RecipeCreateSerializer(ModelSerializer):
             instance,
             context={
                 'request': self.context.get('request'),
+                'image_variant': 'full',
             }
         ).data
+
+
+class RecipeIdsSerializer(Serializer):
+    '''
+    Список id рецептов для пакетного добавления в избранное
+    или корзину и удаления из них.
+    '''
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_recipes(self, recipe_ids):
+        resolve_ids(models.Recipe.objects.only('id'), recipe_ids)
+        return recipe_ids
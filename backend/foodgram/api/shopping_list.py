@@ -0,0 +1,120 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+def get_ingredients(user):
+    '''
+    Сводный список покупок пользователя.
+    '''
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        amount_sum=F('amount'),
+    ).order_by('ingredient__name')
+
+
+def format_ingredient(ingredient):
+    return (
+        f'+ {ingredient["ingredient__name"]} '
+        f'({ingredient["ingredient__measurement_unit"]})'
+        f' - {ingredient["amount_sum"]}'
+    )
+
+
+def iter_text(user, ingredients):
+    '''
+    Построчно отдаёт список покупок в текстовом виде.
+    '''
+    today = timezone.now()
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%d.%m.%Y}\n'
+    )
+    for ingredient in ingredients.iterator():
+        yield format_ingredient(ingredient) + '\n'
+    yield f'\nFoodgram ({today:%Y})'
+
+
+def iter_csv(ingredients):
+    '''
+    Построчно отдаёт список покупок в формате CSV.
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+    for ingredient in ingredients.iterator():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount_sum'],
+        ))
+        yield buffer.getvalue()
+
+
+def get_pdf_font():
+    '''
+    Регистрирует шрифт с кириллицей. Встроенные шрифты PDF
+    кириллицу не отображают, поэтому без него выгрузка невозможна.
+    '''
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if not font_path or not os.path.exists(font_path):
+        raise ImproperlyConfigured(
+            f'Шрифт для PDF {font_path!r} не найден, '
+            'укажите путь к TTF-шрифту в SHOPPING_LIST_PDF_FONT.'
+        )
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def render_pdf(user, ingredients):
+    '''
+    Формирует простой PDF-документ со списком покупок.
+    '''
+    today = timezone.now()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    _, height = A4
+    y = height - PDF_MARGIN
+
+    def write_line(text):
+        nonlocal y
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = height - PDF_MARGIN
+        pdf.setFont(font, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, y, text)
+        y -= PDF_LINE_HEIGHT
+
+    write_line(f'Список покупок для: {user.get_full_name()}')
+    write_line(f'Дата: {today:%d.%m.%Y}')
+    write_line('')
+    for ingredient in ingredients.iterator():
+        write_line(format_ingredient(ingredient))
+    write_line('')
+    write_line(f'Foodgram ({today:%Y})')
+    pdf.save()
+    return buffer.getvalue()
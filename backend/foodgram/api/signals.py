@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+from .authentication import forget_tokens
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    forget_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
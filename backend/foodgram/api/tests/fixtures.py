@@ -0,0 +1,64 @@
+import io
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from api.authentication import local_tokens
+from recipes.models import Ingredient, IngredientAmountInRecipe, Recipe
+from users.models import User
+
+RECIPE_IMAGE = 'recipes/images/recipe.png'
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+    local_tokens.entries.clear()
+
+
+def save_image(name):
+    '''
+    Сохраняет в хранилище настоящее изображение PNG.
+    '''
+    content = io.BytesIO()
+    Image.new('RGB', (32, 32), 'red').save(content, format='PNG')
+    return default_storage.save(name, ContentFile(content.getvalue()))
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='password', **fields,
+    )
+
+
+def create_ingredients(*names):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in names
+    ]
+
+
+def create_recipe(author, name='Рецепт', ingredients=(), tags=(), amount=10):
+    '''
+    Рецепт с изображением RECIPE_IMAGE. ingredients — ингредиенты,
+    которые войдут в рецепт по amount каждого, или словарь
+    ингредиент: количество.
+    '''
+    if not default_storage.exists(RECIPE_IMAGE):
+        save_image(RECIPE_IMAGE)
+    recipe = Recipe.objects.create(
+        author=author, name=name, image=RECIPE_IMAGE, text='Описание',
+        cooking_time=10,
+    )
+    if tags:
+        recipe.tags.set(tags)
+    if not isinstance(ingredients, dict):
+        ingredients = dict.fromkeys(ingredients, amount)
+    for ingredient, ingredient_amount in ingredients.items():
+        IngredientAmountInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=ingredient_amount
+        )
+    return recipe
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.authentication import AUTH_FIELDS, token_cache_key
+from api.tests.fixtures import clear_caches, create_user
+from users.models import User
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    '''
+    Кэш токенов хранит только поля для проверки прав, а запросы
+    на изменение работают с пользователем из БД.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(
+            'user', first_name='Имя', last_name='Фамилия'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        clear_caches()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_cache_keeps_only_auth_fields(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(
+            cache.get(token_cache_key(self.token.key)),
+            {field: getattr(self.user, field) for field in AUTH_FIELDS},
+        )
+
+    def test_me_reads_full_profile(self):
+        self.client.get('/api/recipes/')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'user')
+        self.assertEqual(response.data['first_name'], 'Имя')
+
+    def test_unsafe_request_uses_fresh_user(self):
+        self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(first_name='Новое')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password',
+            'new_password': 'n3w-Passw0rd!',
+        })
+        self.assertEqual(response.status_code, 204, response.data)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Новое')
+        self.assertTrue(self.user.check_password('n3w-Passw0rd!'))
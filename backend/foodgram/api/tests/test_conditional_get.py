@@ -0,0 +1,53 @@
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import (
+    clear_caches,
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.models import IngredientAmountInRecipe
+
+
+class RecipeETagTests(APITestCase):
+    '''
+    ETag карточки рецепта меняется при правке его ингредиентов
+    в обход сериализатора.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipe(create_user('author'))
+        cls.salt, cls.sugar = create_ingredients('Соль', 'Сахар')
+        cls.row = IngredientAmountInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=10
+        )
+
+    def setUp(self):
+        clear_caches()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.etag = self.client.get(self.url)['ETag']
+
+    def assert_etag_changed(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], self.etag)
+
+    def test_unchanged(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_row_saved(self):
+        self.row.amount = 25
+        self.row.save()
+        self.assert_etag_changed()
+
+    def test_row_created(self):
+        IngredientAmountInRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.sugar, amount=5
+        )
+        self.assert_etag_changed()
+
+    def test_row_deleted(self):
+        self.row.delete()
+        self.assert_etag_changed()
@@ -0,0 +1,46 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import clear_caches, create_recipe, create_user
+from recipes.links import add_link
+from recipes.models import Favourite, Recipe
+
+
+class CounterSaveTests(APITestCase):
+    '''
+    Полное сохранение рецепта или пользователя не затирает счётчики,
+    изменённые после загрузки записи.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_recipe_save_keeps_favourites_count(self):
+        recipe = Recipe.objects.get(pk=create_recipe(self.author).pk)
+        add_link(Favourite, self.reader.id, recipe.id)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favourites_count, 1)
+
+    def test_set_password_keeps_recipes_count(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        create_recipe(self.author)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password',
+            'new_password': 'n3w-Passw0rd!',
+        })
+        self.assertEqual(response.status_code, 204, response.data)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.check_password('n3w-Passw0rd!'))
+        self.assertEqual(self.author.recipes_count, 1)
@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.tests.fixtures import create_recipe, create_user, save_image
+from recipes.images import DERIVATIVES_DIR, update_derivatives
+from recipes.models import Recipe
+from recipes.versions import recipe_version_names
+
+
+class ImageDerivativesTests(TestCase):
+    '''
+    Копии изображений создаются после ответа, копии прежнего
+    изображения удаляются, а закэшированные ответы сбрасываются.
+    '''
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.recipe = create_recipe(create_user('author'))
+
+    def derivatives(self):
+        return Recipe.objects.get(pk=self.recipe.pk).image_derivatives
+
+    def files(self, derivatives):
+        return [
+            name for variant, name in derivatives.items()
+            if variant != 'source'
+        ]
+
+    @mock.patch('recipes.images.executor')
+    def test_generates_after_commit(self, executor):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.image = save_image('other.png')
+            self.recipe.save()
+            executor.submit.assert_not_called()
+        executor.submit.assert_called_once()
+        self.assertEqual(self.derivatives(), {})
+
+    @mock.patch('recipes.images.bump_response_versions')
+    def test_replaced_image_derivatives_are_deleted(self, bump):
+        update_derivatives(self.recipe.pk, self.recipe.image.name, {})
+        old = self.derivatives()
+        self.recipe.image = save_image('other.png')
+        self.recipe.save()
+        update_derivatives(self.recipe.pk, self.recipe.image.name, old)
+        new = self.derivatives()
+        self.assertEqual(new['source'], self.recipe.image.name)
+        for name in self.files(old):
+            self.assertFalse(default_storage.exists(name))
+        for name in self.files(new):
+            self.assertTrue(default_storage.exists(name))
+        bump.assert_called_with(set(recipe_version_names(
+            self.recipe.pk, self.recipe.author_id, []
+        )))
+
+    def test_result_for_replaced_image_is_discarded(self):
+        stale = save_image('stale.png')
+        update_derivatives(self.recipe.pk, stale, {})
+        self.assertEqual(self.derivatives(), {})
+        self.assertEqual(
+            default_storage.listdir(DERIVATIVES_DIR), ([], [])
+        )
+
+    @mock.patch(
+        'recipes.management.commands.build_image_derivatives'
+        '.bump_response_versions'
+    )
+    def test_command_bumps_versions(self, bump):
+        call_command(
+            'build_image_derivatives', '--workers', '1', stdout=mock.Mock()
+        )
+        self.assertEqual(self.derivatives()['source'], self.recipe.image.name)
+        bump.assert_called_once_with(set(recipe_version_names(
+            self.recipe.pk, self.recipe.author_id, []
+        )))
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+
+from api.tests.fixtures import (
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.links import add_links
+from recipes.models import (
+    Favourite,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+
+
+class AddLinksTests(TestCase):
+    '''
+    Пакетное добавление учитывает в счётчиках и списке покупок
+    только строки, которые вставило само.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        salt, = create_ingredients('Соль')
+        cls.salt_id = salt.id
+        cls.recipe_ids = [
+            create_recipe(cls.user, f'Рецепт {number}', [salt]).id
+            for number in range(3)
+        ]
+
+    def check_add_links(self, model, counter):
+        first, *others = self.recipe_ids
+        # Строка, которую успел вставить параллельный запрос.
+        model.objects.create(user=self.user, recipe_id=first)
+        self.assertEqual(
+            add_links(model, self.user.id, self.recipe_ids), others
+        )
+        self.assertEqual(
+            list(Recipe.objects.filter(pk__in=self.recipe_ids).order_by(
+                'pk'
+            ).values_list(counter, flat=True)),
+            [1, 1, 1],
+        )
+        self.assertEqual(add_links(model, self.user.id, self.recipe_ids), [])
+
+    def test_add_links(self):
+        for returning in (False, True):
+            features = mock.patch.object(
+                connection.features,
+                'can_return_rows_from_bulk_insert', returning,
+            )
+            for model, counter in (
+                (Favourite, 'favourites_count'),
+                (ShoppingCart, 'in_cart_count'),
+            ):
+                with self.subTest(returning=returning, model=model):
+                    with features:
+                        model.objects.all().delete()
+                        self.check_add_links(model, counter)
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.salt_id, 30)],
+        )
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from foodgram.metrics import ARCHIVE_NAME, MetricsRegistry
+
+METRIC = 'foodgram_db_queries_total'
+
+
+class DeadWorkerMetricsTests(SimpleTestCase):
+    '''
+    Файлы завершившихся процессов переносятся в архив: счётчики
+    не уменьшаются, а файлы не копятся.
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def dead_worker(self, value):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        worker = MetricsRegistry(self.directory)
+        worker.inc(METRIC, {}, value)
+        worker.write(
+            self.directory / f'{process.pid}.json', worker.snapshot()
+        )
+        return process.pid
+
+    def total(self, registry):
+        counters, _ = registry.collect()
+        return counters[METRIC, '[]']
+
+    def test_dead_worker_files_are_archived(self):
+        registry = MetricsRegistry(self.directory)
+        self.dead_worker(2)
+        self.dead_worker(3)
+        self.assertEqual(self.total(registry), 5)
+        self.assertEqual(
+            [path.name for path in self.directory.glob('*.json')],
+            [ARCHIVE_NAME],
+        )
+        self.assertEqual(self.total(registry), 5)
+
+    def test_mark_process_dead(self):
+        registry = MetricsRegistry(self.directory)
+        pid = self.dead_worker(2)
+        registry.mark_process_dead(pid)
+        registry.mark_process_dead(pid)
+        self.assertFalse((self.directory / f'{pid}.json').exists())
+        self.assertEqual(self.total(registry), 2)
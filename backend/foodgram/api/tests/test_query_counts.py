@@ -0,0 +1,125 @@
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import (
+    clear_caches,
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.feed import order_after
+from recipes.models import Favourite, Recipe, ShoppingCart, Tag
+from users.models import Subscribe
+
+
+class RecipeQueryCountTests(APITestCase):
+    '''
+    Число SQL-запросов списка и карточки рецепта не зависит
+    от числа рецептов на странице.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            create_user(
+                f'user{number}', first_name='Имя', last_name='Фамилия'
+            )
+            for number in range(4)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = create_ingredients(*(
+            f'Ингредиент {number}' for number in range(10)
+        ))
+        cls.recipes = [
+            create_recipe(
+                cls.users[number % 4], f'Рецепт {number}',
+                ingredients={
+                    ingredients[(number + position * 3) % 10]: 10 + position
+                    for position in range(3)
+                },
+                tags=tags[:1 + number % 3],
+            )
+            for number in range(8)
+        ]
+        reader = cls.users[0]
+        Favourite.objects.create(user=reader, recipe=cls.recipes[1])
+        ShoppingCart.objects.create(user=reader, recipe=cls.recipes[2])
+        Subscribe.objects.create(subscriber=reader, author=cls.users[1])
+        cls.token = Token.objects.create(user=reader)
+
+    def setUp(self):
+        clear_caches()
+
+    def authenticate(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def count_queries(self, path):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assert_queries_for_page_sizes(self, expected):
+        for limit in (2, 8):
+            with self.subTest(limit=limit):
+                clear_caches()
+                with self.assertNumQueries(expected):
+                    response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_queries_for_page_sizes(6)
+
+    def test_list_authenticated(self):
+        self.authenticate()
+        self.assert_queries_for_page_sizes(8)
+
+    def test_detail(self):
+        self.authenticate()
+        self.assertEqual(
+            self.count_queries(f'/api/recipes/{self.recipes[0].id}/'),
+            self.count_queries(f'/api/recipes/{self.recipes[5].id}/'),
+        )
+        clear_caches()
+        with self.assertNumQueries(8):
+            self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+
+    def test_cursor_pages(self):
+        self.authenticate()
+        path, counts = '/api/recipes/?cursor=&limit=2', []
+        while path:
+            clear_caches()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries.captured_queries))
+            path = response.data['next']
+        self.assertEqual(len(counts), 4)
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_cursor_uses_index_range(self):
+        last = self.recipes[3]
+        queryset = order_after(
+            Recipe.objects.all(), (last.pub_date, last.id), False
+        )[:2]
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+                self.assertIn('Index Cond', plan)
+            else:
+                plan = queryset.explain()
+                self.assertIn('SEARCH', plan)
+        self.assertIn('recipe_pub_date_id_idx', plan)
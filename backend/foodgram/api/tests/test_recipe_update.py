@@ -0,0 +1,96 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import (
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.models import IngredientAmountInRecipe, Tag
+
+TABLE = IngredientAmountInRecipe._meta.db_table
+
+
+class RecipeUpdateWritesTests(APITestCase):
+    '''
+    RecipeCreateSerializer.update пишет в таблицу ингредиентов
+    рецепта только изменившиеся строки.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.token = Token.objects.create(user=cls.author)
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredients = create_ingredients(*(
+            f'Ингредиент {number}' for number in range(4)
+        ))
+
+    def setUp(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+        self.recipe = create_recipe(
+            self.author, ingredients=self.ingredients[:3], tags=[self.tag]
+        )
+
+    def rows(self):
+        return dict(IngredientAmountInRecipe.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient_id', 'pk'))
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        writes = {'INSERT': 0, 'UPDATE': 0, 'DELETE': 0}
+        for query in queries.captured_queries:
+            sql = query['sql']
+            statement = sql.split(None, 1)[0].upper()
+            if statement in writes and f'"{TABLE}"' in sql.split(
+                'WHERE', 1
+            )[0]:
+                writes[statement] += 1
+        return writes
+
+    def ingredients_payload(self, amounts):
+        return [
+            {'id': ingredient.id, 'amount': amount}
+            for ingredient, amount in amounts
+        ]
+
+    def test_title_only(self):
+        writes = self.patch({'name': 'Новое название'})
+        self.assertEqual(writes, {'INSERT': 0, 'UPDATE': 0, 'DELETE': 0})
+
+    def test_amount_only(self):
+        first, second, third = self.ingredients[:3]
+        before = self.rows()
+        writes = self.patch({'ingredients': self.ingredients_payload(
+            [(first, 25), (second, 10), (third, 10)]
+        )})
+        self.assertEqual(writes, {'INSERT': 0, 'UPDATE': 1, 'DELETE': 0})
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(
+            IngredientAmountInRecipe.objects.get(
+                recipe=self.recipe, ingredient=first
+            ).amount,
+            25,
+        )
+
+    def test_add_and_remove(self):
+        first, second, third, fourth = self.ingredients
+        before = self.rows()
+        writes = self.patch({'ingredients': self.ingredients_payload(
+            [(first, 10), (second, 10), (fourth, 5)]
+        )})
+        self.assertEqual(writes, {'INSERT': 1, 'UPDATE': 0, 'DELETE': 1})
+        after = self.rows()
+        self.assertNotIn(third.id, after)
+        self.assertIn(fourth.id, after)
+        self.assertEqual(after[first.id], before[first.id])
+        self.assertEqual(after[second.id], before[second.id])
@@ -0,0 +1,55 @@
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import clear_caches, create_recipe, create_user
+from recipes.models import Tag
+from recipes.versions import get_response_versions
+
+
+class AuthorInvalidationTests(APITestCase):
+    '''
+    Изменение пользователя сбрасывает только кэш ответов
+    с его рецептами.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author', first_name='Автор')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author, tags=[
+            Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ])
+        cls.names = [
+            f'recipe:{cls.recipe.id}', 'recipe-list',
+            f'recipe-list:author:{cls.author.id}', 'recipe-list:tag:tag',
+        ]
+
+    def setUp(self):
+        clear_caches()
+
+    def save_user(self, user, first_name):
+        user.first_name = first_name
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_author_change_refreshes_cached_recipe(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(
+            self.client.get(url).data['author']['first_name'], 'Автор'
+        )
+        versions = get_response_versions(self.names)
+        self.save_user(self.author, 'Новое имя')
+        self.assertEqual(
+            self.client.get(url).data['author']['first_name'], 'Новое имя'
+        )
+        self.assertTrue(all(
+            old != new for old, new in zip(
+                versions, get_response_versions(self.names)
+            )
+        ))
+
+    def test_user_without_recipes_keeps_cache(self):
+        versions = get_response_versions([*self.names, 'tags'])
+        self.save_user(self.reader, 'Читатель')
+        self.assertEqual(
+            get_response_versions([*self.names, 'tags']), versions
+        )
@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api import shopping_list
+from api.tests.fixtures import (
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.models import (
+    IngredientAmountInRecipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+
+
+class IngredientRowSignalsTests(TestCase):
+    '''
+    Правки строк ингредиентов рецепта в обход сериализатора
+    (например, из админки) переносятся в списки покупок.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.buyer = create_user('buyer')
+        cls.salt, cls.sugar = create_ingredients('Соль', 'Сахар')
+        cls.recipe = create_recipe(cls.author)
+        cls.row = IngredientAmountInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=10
+        )
+        ShoppingCart.objects.create(user=cls.buyer, recipe=cls.recipe)
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.buyer
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_change_amount(self):
+        self.row.amount = 25
+        self.row.save()
+        self.assertEqual(self.shopping_list(), {self.salt.id: 25})
+
+    def test_change_amount_without_extra_query(self):
+        row = IngredientAmountInRecipe.objects.get(pk=self.row.pk)
+        for amount in (25, 30):
+            row.amount = amount
+            with CaptureQueriesContext(connection) as queries:
+                row.save()
+            self.assertFalse([
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT')
+                and f'FROM "{IngredientAmountInRecipe._meta.db_table}"'
+                in query['sql']
+            ])
+            self.assertEqual(self.shopping_list(), {self.salt.id: amount})
+
+    def test_change_ingredient(self):
+        self.row.ingredient = self.sugar
+        self.row.save()
+        self.assertEqual(self.shopping_list(), {self.sugar.id: 10})
+
+    def test_add_and_delete(self):
+        IngredientAmountInRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.sugar, amount=5
+        )
+        self.assertEqual(
+            self.shopping_list(), {self.salt.id: 10, self.sugar.id: 5}
+        )
+        self.row.delete()
+        self.assertEqual(self.shopping_list(), {self.sugar.id: 5})
+
+    def test_recipe_delete(self):
+        self.recipe.delete()
+        self.assertEqual(self.shopping_list(), {})
+
+    def create_carted_recipe(self, author):
+        recipe = create_recipe(
+            author, 'Другой рецепт', [self.salt], amount=7
+        )
+        ShoppingCart.objects.create(user=self.buyer, recipe=recipe)
+        self.assertEqual(self.shopping_list(), {self.salt.id: 17})
+
+    def test_recipe_delete_keeps_shared_ingredient(self):
+        self.create_carted_recipe(self.buyer)
+        self.recipe.delete()
+        self.assertEqual(self.shopping_list(), {self.salt.id: 7})
+
+    def test_author_delete_keeps_shared_ingredient(self):
+        self.create_carted_recipe(self.buyer)
+        self.author.delete()
+        self.assertEqual(self.shopping_list(), {self.salt.id: 7})
+
+
+class DownloadShoppingCartTests(APITestCase):
+    '''
+    Формат списка покупок выбирается только по ?format=,
+    по умолчанию отдаётся текст.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        buyer = create_user('buyer')
+        cls.token = Token.objects.create(user=buyer)
+        recipe = create_recipe(buyer, ingredients=create_ingredients('Соль'))
+        ShoppingCart.objects.create(user=buyer, recipe=recipe)
+
+    def setUp(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def download(self, query='', accept='*/*'):
+        return self.client.get(
+            f'/api/recipes/download_shopping_cart/{query}',
+            HTTP_ACCEPT=accept,
+        )
+
+    def test_accept_header_falls_back_to_text(self):
+        for accept in ('application/json', 'text/html', '*/*'):
+            with self.subTest(accept=accept):
+                response = self.download(accept=accept)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(
+                    response['Content-Type'].startswith('text/plain')
+                )
+
+    def test_format_parameter(self):
+        response = self.download('?format=csv', accept='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('.csv', response['Content-Disposition'])
+
+    def test_unknown_format_falls_back_to_text(self):
+        response = self.download('?format=xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font_fails(self):
+        with mock.patch.object(
+            shopping_list.pdfmetrics, 'getRegisteredFontNames',
+            return_value=[],
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                self.download('?format=pdf')
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.tests.fixtures import (
+    create_ingredients,
+    create_recipe,
+    create_user
+)
+from recipes.management.commands.build_similar_recipes import Command
+from recipes.models import IngredientAmountInRecipe, Recipe
+
+
+class BuildSimilarRecipesTests(TestCase):
+    '''
+    Пересчёт снимает флаг устаревших похожих рецептов, кроме
+    рецептов, изменённых во время пересчёта.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.ingredients = create_ingredients(*(
+            f'Ингредиент {number}' for number in range(3)
+        ))
+        cls.recipes = [
+            create_recipe(author, f'Рецепт {number}', cls.ingredients[:2])
+            for number in range(2)
+        ]
+
+    def stale(self):
+        return set(Recipe.objects.filter(
+            similarity_stale=True
+        ).values_list('id', flat=True))
+
+    def build(self, *args):
+        call_command('build_similar_recipes', *args, stdout=mock.Mock())
+
+    def test_clears_flag(self):
+        for args in ((), ('--full',)):
+            with self.subTest(args=args):
+                Recipe.objects.update(similarity_stale=True)
+                self.build(*args)
+                self.assertEqual(self.stale(), set())
+
+    def test_keeps_flag_of_recipes_changed_during_run(self):
+        edited = self.recipes[0]
+        rebuild = Command.rebuild
+
+        def rebuild_and_edit(command, *args):
+            rebuild(command, *args)
+            IngredientAmountInRecipe.objects.get_or_create(
+                recipe=edited, ingredient=self.ingredients[2], amount=5
+            )
+
+        for args in ((), ('--full',)):
+            with self.subTest(args=args):
+                IngredientAmountInRecipe.objects.filter(
+                    ingredient=self.ingredients[2]
+                ).delete()
+                with mock.patch.object(Command, 'rebuild', rebuild_and_edit):
+                    self.build(*args)
+                self.assertEqual(self.stale(), {edited.id})
+
+    def test_full_save_keeps_flag(self):
+        Recipe.objects.update(similarity_stale=False)
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        Recipe.objects.filter(pk=recipe.pk).update(similarity_stale=True)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertTrue(recipe.similarity_stale)
@@ -12,6 +12,7 @@ router.register('ingredients', views.IngredientViewSet, basename='ingredients')
 router.register('recipes', views.RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
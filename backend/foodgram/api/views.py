@@ -1,20 +1,48 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from collections import defaultdict
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from foodgram.metrics import registry
 from recipes import models
+from recipes.feed import backfill, prune
+from recipes.links import (
+    add_link,
+    add_links,
+    delete_rows,
+    insert_ignore,
+    remove_link,
+    remove_links
+)
+from recipes.versions import (
+    bump_version,
+    get_version,
+    membership_version_name,
+    recipe_list_version_names
+)
 from users.models import Subscribe, User
-from . import serializers
-from .filters import IngredientSearchFilter, RecipeFilterSet
-from .pagination import CustomPagination
-from .permissions import IsAuthorOrAdminOrReadOnly
+from . import serializers, shopping_list
+from .authentication import load_profile
+from .filters import RecipeFilterSet
+from .mixins import AnonymousResponseCacheMixin, ConditionalGetMixin
+from .negotiation import FormatContentNegotiation
+from .pagination import CustomPagination, FeedPagination, RecipePagination
+from .permissions import IsAdminOrInternalIP, IsAuthorOrAdminOrReadOnly
+from .renderers import (
+    CSVRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+    PrometheusRenderer
+)
+from .search import ingredient_index
 
 
 class CustomUserViewSet(UserViewSet):
@@ -25,6 +53,13 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = serializers.CustomUserSerializer
     pagination_class = CustomPagination
 
+    def get_instance(self):
+        '''
+        Пользователь из кэша токенов загружен не полностью:
+        остальные поля профиля читаются одним запросом.
+        '''
+        return load_profile(self.request.user)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -33,33 +68,37 @@ class CustomUserViewSet(UserViewSet):
     def subscribe(self, request, **kwargs):
         subscriber = request.user
         author_id = self.kwargs.get('id')
-        author = get_object_or_404(User, id=author_id)
+        if not author_id.isdigit():
+            raise NotFound()
+        author_id = int(author_id)
 
         if request.method == 'POST':
-            serializer = serializers.SubscriptionSerializer(
-                data={
-                    'subscriber': subscriber.id,
-                    'author': author.id,
-                },
-                context={'request': request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(
-                subscriber=subscriber,
-                author=author
-            )
+            if author_id == subscriber.id:
+                raise ValidationError({
+                    'errors': 'Подписка на себя запрещена.',
+                })
+            if not insert_ignore(
+                Subscribe(subscriber=subscriber, author_id=author_id),
+                User.objects.filter(pk=author_id),
+            ):
+                get_object_or_404(User, id=author_id)
+                raise ValidationError({
+                    'errors': 'Вы уже подписаны на этого автора.',
+                })
+            backfill(subscriber.id, author_id)
+            bump_version(membership_version_name(subscriber.id))
             return Response(
-                serializer.data,
+                {'subscriber': subscriber.id, 'author': author_id},
                 status=status.HTTP_201_CREATED
             )
 
-        subscription = get_object_or_404(
-            Subscribe,
-            subscriber=request.user,
-            author=author
+        subscriptions = Subscribe.objects.filter(
+            subscriber=subscriber, author_id=author_id
         )
-
-        subscription.delete()
+        if not delete_rows(subscriptions):
+            raise NotFound()
+        prune(subscriber.id, author_id)
+        bump_version(membership_version_name(subscriber.id))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -68,8 +107,11 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         subscriber = request.user
-        queryset = User.objects.filter(author__subscriber=subscriber)
+        queryset = User.objects.filter(
+            author__subscriber=subscriber
+        ).order_by('-date_joined')
         pages = self.paginate_queryset(queryset)
+        self.attach_recipes(pages, self.get_recipes_limit(request))
         serializer = serializers.SubscriptionShowSerializer(
             pages,
             many=True,
@@ -77,27 +119,74 @@ class CustomUserViewSet(UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self, request):
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        if not recipes_limit.isdigit() or int(recipes_limit) < 1:
+            raise ValidationError({
+                'recipes_limit': 'Должно быть положительным целым числом.',
+            })
+        return int(recipes_limit)
 
-class TagViewSet(ModelViewSet):
+    def attach_recipes(self, authors, recipes_limit):
+        '''
+        Загружает рецепты всех авторов страницы одним запросом.
+        '''
+        recipes = models.Recipe.objects.filter(author__in=authors)
+        if recipes_limit:
+            recipes = recipes.top_per_author(recipes_limit)
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.page_recipes = recipes_by_author[author.id]
+
+
+class TagViewSet(ConditionalGetMixin, ModelViewSet):
     '''
     Вьюсет для создания тегов.
     '''
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
 
+    def get_list_validators(self, request):
+        return get_version('tags')
+
+    get_object_validators = get_list_validators
+
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ModelViewSet):
     '''
     Вьюсет для создания ингредиентов.
     '''
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
 
+    def get_list_validators(self, request):
+        return get_version('ingredients')
 
-class RecipeViewSet(ModelViewSet):
+    get_object_validators = get_list_validators
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_list_validators(request),
+            self.search, *args, **kwargs
+        )
+
+    def search(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        ingredients = (
+            ingredient_index.search(name) if name
+            else ingredient_index.all()
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+
+class RecipeViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                    ModelViewSet):
     '''
     Вьюсет для создания рецептов.
     '''
@@ -106,24 +195,81 @@ class RecipeViewSet(ModelViewSet):
         IsAuthorOrAdminOrReadOnly,
         permissions.IsAuthenticatedOrReadOnly
     )
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilterSet
+    vary_on_authorization = True
+    cache_query_params = (
+        'page', 'limit', 'cursor', 'tags', 'author',
+        'is_favorited', 'is_in_shopping_cart',
+    )
+
+    def get_cache_versions(self, request):
+        '''
+        Список зависит от фильтров по тегам и автору, рецепт — от себя.
+        Теги и ингредиенты входят в каждый ответ. Изменение автора
+        сбрасывает версии его рецептов и списков с ними.
+        '''
+        if self.action == 'retrieve':
+            names = [f'recipe:{self.kwargs["pk"]}']
+        else:
+            names = recipe_list_version_names(
+                author_id=request.query_params.get('author'),
+                tag_slugs=sorted(
+                    {slug for slug in request.query_params.getlist('tags')
+                     if slug}
+                ),
+            )
+        return [*names, 'tags', 'ingredients']
+
+    def get_object_validators(self, request):
+        '''
+        Валидаторы рецепта: время его изменения и версия избранного,
+        корзины и подписок пользователя, от которых зависят флаги.
+        '''
+        pk = self.kwargs['pk']
+        updated_at = pk.isdigit() and models.Recipe.objects.filter(
+            pk=pk
+        ).values_list('updated_at', flat=True).first()
+        if not updated_at:
+            return None
+        etag = f'{pk}-{updated_at.timestamp()}'
+        if not request.user.is_authenticated:
+            return etag, updated_at
+        token, changed_at = get_version(
+            membership_version_name(request.user.id)
+        )
+        return f'{etag}-{token}', max(updated_at, changed_at)
+
+    def get_queryset(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            return models.Recipe.objects.with_relations()
+        return models.Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return serializers.RecipeSerializer
         return serializers.RecipeCreateSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['image_variant'] = 'full'
+        return context
+
     def add_recipe(self, model, user, pk):
-        recipe = get_object_or_404(models.Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
+        if not pk.isdigit():
+            raise NotFound()
+        if not add_link(model, user.id, int(pk)):
+            get_object_or_404(models.Recipe, id=pk)
+            raise ValidationError({'errors': 'Рецепт уже добавлен.'})
+        recipe = models.Recipe.objects.get(id=pk)
         serializer = serializers.RecipeShortSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_recipe(self, model, user, pk):
-        object = model.objects.filter(user=user, recipe__id=pk)
-        object.delete()
+        if pk.isdigit():
+            remove_link(model, user.id, int(pk))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -146,37 +292,153 @@ class RecipeViewSet(ModelViewSet):
             return self.add_recipe(models.ShoppingCart, request.user, pk)
         return self.delete_recipe(models.ShoppingCart, request.user, pk)
 
+    def change_recipes(self, model, request):
+        '''
+        Пакетно добавляет рецепты в избранное или корзину (POST)
+        или убирает их оттуда (DELETE) и возвращает итоговый список.
+        '''
+        serializer = serializers.RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            changed = add_links(model, request.user.id, recipe_ids)
+        else:
+            changed = remove_links(model, request.user.id, recipe_ids)
+        return self.recipes_state(model, request.user, changed)
+
+    def recipes_state(self, model, user, changed):
+        return Response({
+            'changed': changed,
+            'recipes': list(model.objects.filter(user=user).order_by(
+                'recipe_id'
+            ).values_list('recipe_id', flat=True)),
+        })
+
+    @action(detail=False, pagination_class=CustomPagination)
+    def pantry(self, request):
+        '''
+        Рецепты из имеющихся продуктов, от лучше покрытых.
+        '''
+        params = serializers.PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(models.Recipe.objects.by_pantry(
+            params.validated_data['ingredients'],
+            params.validated_data.get('max_missing'),
+        ))
+        serializer = serializers.PantryRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        '''
+        Похожие рецепты из таблицы соседей, от самых похожих.
+        '''
+        if not pk.isdigit():
+            raise NotFound()
+        neighbours = list(models.RecipeNeighbour.objects.filter(
+            recipe_id=pk
+        ).select_related('neighbour'))
+        if not neighbours:
+            get_object_or_404(models.Recipe, id=pk)
+        serializer = serializers.RecipeShortSerializer(
+            [neighbour.neighbour for neighbour in neighbours],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
     @action(
         detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        '''
+        Рецепты авторов из подписок пользователя, от новых к старым.
+        '''
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def favorite_bulk(self, request):
+        return self.change_recipes(models.Favourite, request)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_recipes(models.ShoppingCart, request)
+
+    @action(
+        detail=False,
+        methods=['delete'],
+        url_path='shopping_cart/clear',
+        url_name='shopping-cart-clear',
         permission_classes=[permissions.IsAuthenticated]
     )
+    def clear_shopping_cart(self, request):
+        changed = remove_links(models.ShoppingCart, request.user.id)
+        return self.recipes_state(models.ShoppingCart, request.user, changed)
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer],
+        content_negotiation_class=FormatContentNegotiation,
+    )
     def download_shopping_cart(self, request):
         user = request.user
         if not user.shopping_cart.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        load_profile(user)
 
-        ingredients = models.IngredientAmountInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount_sum=Sum('amount'))
-
-        today = timezone.now()
-        shopping_card_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%d.%m.%Y}\n'
-        )
-        shopping_card_list += '\n'.join([
-            f'+ {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount_sum"]}'
-            for ingredient in ingredients
-        ])
-        shopping_card_list += f'\n\nFoodgram ({today:%Y})'
-
-        filename = f'{user.username}_shopping_card_list.txt'
-        response = HttpResponse(shopping_card_list, content_type='text/plain')
+        ingredients = shopping_list.get_ingredients(user)
+        renderer = request.accepted_renderer
+        if renderer.format == PDFRenderer.format:
+            response = HttpResponse(
+                shopping_list.render_pdf(user, ingredients),
+                content_type=renderer.media_type,
+            )
+        else:
+            content = (
+                shopping_list.iter_csv(ingredients)
+                if renderer.format == CSVRenderer.format
+                else shopping_list.iter_text(user, ingredients)
+            )
+            response = StreamingHttpResponse(
+                content,
+                content_type=f'{renderer.media_type}; '
+                             f'charset={renderer.charset}',
+            )
+
+        filename = f'{user.username}_shopping_card_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
 
         return response
+
+
+class MetricsView(APIView):
+    '''
+    Метрики всех процессов сервиса в формате Prometheus.
+    '''
+    permission_classes = (IsAdminOrInternalIP,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
@@ -0,0 +1,268 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Описание метрик: тип, подсказка и границы корзин гистограммы.
+METRICS = {
+    'foodgram_http_requests_total': (
+        'counter', 'Число обработанных запросов.', None,
+    ),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.', LATENCY_BUCKETS,
+    ),
+    'foodgram_db_queries_total': (
+        'counter', 'Число SQL-запросов.', None,
+    ),
+    'foodgram_db_queries_per_request': (
+        'histogram', 'Число SQL-запросов на один запрос.', QUERY_BUCKETS,
+    ),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кэшам по результату hit или miss.', None,
+    ),
+}
+
+
+ARCHIVE_NAME = 'archive.json'
+ARCHIVE_LOCK_NAME = 'archive.lock'
+
+
+class MetricsRegistry:
+    '''
+    Метрики процесса. Каждый процесс хранит свои значения в памяти
+    и периодически сбрасывает их в файл METRICS_DIR/<pid>.json,
+    откуда их собирает процесс, отдающий /api/metrics.
+    Файлы завершившихся процессов переносятся в общий архив,
+    как в режиме multiprocess у prometheus_client: счётчики
+    не уменьшаются, а файлы не копятся.
+    Без METRICS_DIR метрики видны только в текущем процессе.
+    '''
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = 0.0
+        self.flushed_pid = None
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, self.key(labels)] += value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                (name, self.key(labels)), [0] * (len(buckets) + 2)
+            )
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    @staticmethod
+    def key(labels):
+        return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+    def snapshot(self):
+        with self.lock:
+            return to_snapshot(self.counters, self.histograms)
+
+    @property
+    def path(self):
+        return self.directory / f'{os.getpid()}.json'
+
+    @property
+    def archive_path(self):
+        return self.directory / ARCHIVE_NAME
+
+    def maybe_flush(self):
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if now - self.flushed_at >= self.flush_interval:
+            self.flushed_at = now
+            self.flush()
+
+    def flush(self):
+        '''
+        Атомарно перезаписывает файл процесса. Файл, оставшийся
+        от прежнего процесса с тем же pid, сначала уходит в архив.
+        '''
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        if self.flushed_pid != pid:
+            self.mark_process_dead(pid)
+            self.flushed_pid = pid
+        self.write(self.path, self.snapshot())
+
+    def write(self, path, snapshot):
+        with tempfile.NamedTemporaryFile(
+            'w', dir=self.directory, suffix='.tmp', delete=False
+        ) as file:
+            json.dump(snapshot, file, ensure_ascii=False)
+        os.replace(file.name, path)
+
+    @staticmethod
+    def read(path):
+        try:
+            return json.loads(path.read_text('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def mark_process_dead(self, pid):
+        '''
+        Прибавляет метрики завершившегося процесса к архиву
+        и удаляет его файл. Вызывается из хука child_exit gunicorn
+        и при сборе метрик для файлов процессов, которых больше нет.
+        '''
+        if self.directory is None or not self.directory.exists():
+            return
+        path = self.directory / f'{pid}.json'
+        with open(self.directory / ARCHIVE_LOCK_NAME, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshot = self.read(path)
+            if snapshot is None:
+                return
+            archive = self.read(self.archive_path)
+            self.write(self.archive_path, to_snapshot(*merge(
+                [archive, snapshot] if archive else [snapshot]
+            )))
+            path.unlink()
+
+    def collect(self):
+        '''
+        Складывает метрики всех процессов и архива. Для текущего
+        процесса берутся значения из памяти, а не из файла.
+        '''
+        snapshots = [self.snapshot()]
+        if self.directory is not None and self.directory.exists():
+            for path in self.directory.glob('*.json'):
+                if path == self.path or not path.stem.isdigit():
+                    continue
+                if not process_alive(int(path.stem)):
+                    self.mark_process_dead(int(path.stem))
+                    continue
+                snapshot = self.read(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            archive = self.read(self.archive_path)
+            if archive is not None:
+                snapshots.append(archive)
+        return merge(snapshots)
+
+    def render(self):
+        '''
+        Метрики в текстовом формате Prometheus.
+        '''
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, key), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(
+                            f'{name}{format_labels(key)} {format_value(value)}'
+                        )
+                continue
+            for (metric, key), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{format_labels(key, le=bound)} '
+                        f'{format_value(cumulative)}'
+                    )
+                labels = format_labels(key)
+                lines.append(f'{name}_sum{labels} {format_value(values[-1])}')
+                lines.append(
+                    f'{name}_count{labels} {format_value(cumulative)}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def to_snapshot(counters, histograms):
+    return {
+        'counters': [
+            [name, key, value]
+            for (name, key), value in counters.items()
+        ],
+        'histograms': [
+            [name, key, list(values)]
+            for (name, key), values in histograms.items()
+        ],
+    }
+
+
+def merge(snapshots):
+    '''
+    Складывает счётчики и гистограммы нескольких снимков.
+    '''
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, key, value in snapshot['counters']:
+            counters[name, key] += value
+        for name, key, values in snapshot['histograms']:
+            total = histograms.setdefault((name, key), [0] * len(values))
+            for position, value in enumerate(values):
+                total[position] += value
+    return counters, histograms
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def format_labels(key, **extra):
+    labels = json.loads(key) + [
+        [name, str(value)] for name, value in extra.items()
+    ]
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for name, value in labels
+    ) + '}'
+
+
+def record_cache(cache, hit):
+    registry.inc(
+        'foodgram_cache_requests_total',
+        {'cache': cache, 'result': 'hit' if hit else 'miss'},
+    )
+
+
+registry = MetricsRegistry(
+    settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL
+)
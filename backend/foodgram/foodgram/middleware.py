@@ -0,0 +1,119 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+from .performance import RequestMetrics, current_metrics
+
+logger = logging.getLogger('foodgram.performance')
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class PerformanceMiddleware:
+    '''
+    Замеряет число SQL-запросов, время в БД, время сериализации
+    и общее время обработки запроса. Итоги отдаются в заголовке
+    Server-Timing, а медленные запросы пишутся в лог
+    вместе с самыми долгими SQL-запросами.
+    Замеряется только доля запросов PERFORMANCE_SAMPLE_RATE.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PERFORMANCE_SAMPLE_RATE
+        self.slow_request_ms = settings.PERFORMANCE_SLOW_REQUEST_MS
+        self.slow_queries_count = settings.PERFORMANCE_SLOW_QUERIES_COUNT
+        self.logged_queries = settings.PERFORMANCE_LOGGED_QUERIES
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total_ms = metrics.elapsed * 1000
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{len(metrics.queries)} queries"',
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ))
+        if (
+            total_ms >= self.slow_request_ms
+            or len(metrics.queries) >= self.slow_queries_count
+        ):
+            self.log(request, response, metrics, total_ms)
+        return response
+
+    def log(self, request, response, metrics, total_ms):
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'serializer_ms': round(metrics.serializer_time * 1000, 1),
+            'queries': len(metrics.queries),
+            'slowest_queries': metrics.slowest_queries(self.logged_queries),
+        }, ensure_ascii=False))
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    '''
+    Собирает для /api/metrics число запросов по представлениям
+    и кодам ответа, время обработки и число SQL-запросов.
+    Представление определяется по имени маршрута, например
+    recipes-list или users-subscriptions.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unknown'
+        method = request.method if request.method in HTTP_METHODS else 'OTHER'
+        labels = {'view': view, 'method': method}
+        registry.inc('foodgram_http_requests_total', {
+            **labels, 'status': str(response.status_code),
+        })
+        registry.observe(
+            'foodgram_http_request_duration_seconds', labels, duration
+        )
+        registry.inc('foodgram_db_queries_total', labels, counter.count)
+        registry.observe(
+            'foodgram_db_queries_per_request', labels, counter.count
+        )
+        registry.maybe_flush()
+        return response
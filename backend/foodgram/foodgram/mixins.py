@@ -0,0 +1,31 @@
+class UpdateOnlyFieldsMixin:
+    '''
+    Модель с полями, которые после вставки записи меняют только
+    атомарные UPDATE: счётчики и служебные флаги. Полное
+    сохранение существующей записи такие поля не пишет, иначе
+    затёрло бы их значениями, загруженными раньше. Поля,
+    названные в update_fields явно, сохраняются, отложенные
+    поля не пишутся, как и в Model.save.
+    '''
+    update_only_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (
+            update_fields is None
+            and not force_insert
+            and not self._state.adding
+        ):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.update_only_fields
+                and field.attname not in deferred
+            ]
+        super().save(
+            force_insert=force_insert,
+            force_update=force_update,
+            using=using,
+            update_fields=update_fields,
+        )
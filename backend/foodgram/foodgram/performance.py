@@ -0,0 +1,63 @@
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    '''
+    Замеры одного запроса: SQL-запросы, время в БД и сериализации.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        '''
+        Обёртка для connection.execute_wrapper.
+        '''
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.db_time += duration
+            self.queries.append((duration, sql))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def slowest_queries(self, count):
+        return [
+            {'sql': sql, 'ms': round(duration * 1000, 2)}
+            for duration, sql in heapq.nlargest(
+                count, self.queries, key=lambda query: query[0]
+            )
+        ]
+
+
+@contextmanager
+def serializer_timer():
+    '''
+    Засекает время сериализации. Вложенные сериализаторы
+    не учитываются повторно: считается только внешний вызов.
+    '''
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if not metrics.serializer_depth:
+            metrics.serializer_time += time.perf_counter() - started
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.MetricsMiddleware',
+    'foodgram.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +74,32 @@ DATABASES = {
     }
 }
 
+# Версии каталогов, индекс ингредиентов, ETag и кэш токенов
+# должны быть общими для всех процессов и хостов, поэтому кэши
+# по умолчанию лежат в Redis. LocMemCache и FileBasedCache
+# годятся только для разработки.
+REDIS_URL = os.getenv('REDIS_URL', default='redis://redis:6379')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', default='django_redis.cache.RedisCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=f'{REDIS_URL}/0'),
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND', default='django_redis.cache.RedisCache'
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default=f'{REDIS_URL}/1'
+        ),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)),
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,10 +143,23 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ]
 }
 
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv('TOKEN_CACHE_LOCAL_TTL', default=5))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=1024))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', default=10))
+
+# Потоки процесса, создающие уменьшенные копии изображений рецептов.
+IMAGE_DERIVATIVES_WORKERS = int(
+    os.getenv('IMAGE_DERIVATIVES_WORKERS', default=2)
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -135,3 +176,54 @@ DJOSER = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+
+TEST_RUNNER = 'foodgram.test_runner.IsolatedTestRunner'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Доля запросов, для которых замеряется производительность.
+PERFORMANCE_SAMPLE_RATE = float(
+    os.getenv('PERFORMANCE_SAMPLE_RATE', default='0.1')
+)
+# Пороги, после которых запрос попадает в лог foodgram.performance.
+PERFORMANCE_SLOW_REQUEST_MS = float(
+    os.getenv('PERFORMANCE_SLOW_REQUEST_MS', default='500')
+)
+PERFORMANCE_SLOW_QUERIES_COUNT = int(
+    os.getenv('PERFORMANCE_SLOW_QUERIES_COUNT', default='50')
+)
+# Сколько самых долгих SQL-запросов писать в лог.
+PERFORMANCE_LOGGED_QUERIES = int(
+    os.getenv('PERFORMANCE_LOGGED_QUERIES', default='5')
+)
+
+# Каталог, через который процессы gunicorn объединяют метрики.
+# Его очищает при запуске хук on_starting из gunicorn.conf.py.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(
+    os.getenv('METRICS_FLUSH_INTERVAL', default='1')
+)
+# Адреса и подсети, которым /api/metrics доступен без авторизации.
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', default='127.0.0.1,::1'
+).split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERFORMANCE_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
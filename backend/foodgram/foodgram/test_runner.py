@@ -0,0 +1,38 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    '''
+    Запускает тесты с кэшами в памяти процесса и временным
+    MEDIA_ROOT: тесты очищают кэши и сохраняют изображения
+    и не должны ни задевать общий Redis и файлы сервиса,
+    ни зависеть от них.
+    '''
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            CACHES={
+                alias: {
+                    **options,
+                    'BACKEND': LOCMEM_BACKEND,
+                    'LOCATION': f'test-{alias}',
+                }
+                for alias, options in settings.CACHES.items()
+            },
+            MEDIA_ROOT=self.media_root,
+        )
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
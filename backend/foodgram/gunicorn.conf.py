@@ -0,0 +1,22 @@
+import os
+import shutil
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+def on_starting(server):
+    '''
+    Метрики прошлого запуска сервиса не переносятся в новый.
+    '''
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def child_exit(server, worker):
+    '''
+    Метрики завершившегося воркера уходят в архив METRICS_DIR.
+    '''
+    from foodgram.metrics import registry
+
+    registry.mark_process_dead(worker.pid)
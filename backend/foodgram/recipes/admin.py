@@ -1,8 +1,45 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 
 from . import models
 
 
+class InputFilter(admin.SimpleListFilter):
+    '''
+    Фильтр с полем ввода вместо списка вариантов: не перебирает
+    все значения столбца, поэтому подходит для больших таблиц.
+    '''
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (name, value)
+            for name, value in changelist.get_filters_params().items()
+            if name != self.parameter_name
+        ]
+        yield all_choice
+
+
+class AuthorFilter(InputFilter):
+    '''
+    Фильтр рецептов по имени пользователя автора.
+    '''
+    title = 'Автор'
+    parameter_name = 'author_username'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author__username=self.value().strip())
+        return queryset
+
+
 @admin.register(models.Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
@@ -11,10 +48,23 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'get_ingredients',
         'get_tags',
-        'count_favourites',
+        'favourites_count',
+        'in_cart_count',
     )
+    list_select_related = ('author',)
     search_fields = ('author__username', 'name', 'tags__name',)
-    list_filter = ('author', 'name', 'tags',)
+    list_filter = (AuthorFilter, 'tags',)
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch(
+                'ingredients',
+                queryset=models.Ingredient.objects.only('name'),
+            ),
+            Prefetch('tags', queryset=models.Tag.objects.only('name')),
+        )
 
     def get_ingredients(self, object):
         return ',\n'.join(
@@ -28,27 +78,35 @@ class RecipeAdmin(admin.ModelAdmin):
 
     get_tags.short_description = 'Теги'
 
-    def count_favourites(self, object):
-        return object.favourites.count()
-
-    count_favourites.short_description = 'Раз в избранном'
-
 
 @admin.register(models.Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit',)
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
 
 
 @admin.register(models.Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug',)
+    search_fields = ('name', 'slug',)
 
 
 @admin.register(models.ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe', 'get_ingredients',)
+    list_select_related = ('user', 'recipe',)
+    search_fields = ('user__username', 'recipe__name',)
+    autocomplete_fields = ('user', 'recipe',)
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch(
+                'recipe__ingredients',
+                queryset=models.Ingredient.objects.only('name'),
+            ),
+        )
 
     def get_ingredients(self, object):
         return ',\n'.join(
@@ -61,8 +119,16 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 @admin.register(models.Favourite)
 class FavouriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe',)
+    search_fields = ('user__username', 'recipe__name',)
+    autocomplete_fields = ('user', 'recipe',)
+    show_full_result_count = False
 
 
 @admin.register(models.IngredientAmountInRecipe)
 class IngredientAmountInRecipeAdmin(admin.ModelAdmin):
     list_display = ('ingredient', 'recipe', 'amount',)
+    list_select_related = ('ingredient', 'recipe',)
+    search_fields = ('recipe__name', 'ingredient__name',)
+    autocomplete_fields = ('ingredient', 'recipe',)
+    show_full_result_count = False
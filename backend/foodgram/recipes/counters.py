@@ -0,0 +1,57 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import User
+from .models import (
+    Favourite,
+    IngredientAmountInRecipe,
+    Recipe,
+    ShoppingCart
+)
+
+# Счётчик: модель, поле счётчика, считаемая модель и её внешний ключ.
+COUNTERS = (
+    (Recipe, 'favourites_count', Favourite, 'recipe'),
+    (Recipe, 'in_cart_count', ShoppingCart, 'recipe'),
+    (Recipe, 'ingredients_count', IngredientAmountInRecipe, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+# Счётчики рецепта, которые ведут избранное и корзина.
+LINK_COUNTERS = {
+    Favourite: 'favourites_count',
+    ShoppingCart: 'in_cart_count',
+}
+
+
+def change_counter(queryset, field, delta):
+    '''
+    Атомарно изменяет счётчик у записей queryset, не опускаясь ниже нуля.
+    '''
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def actual_count(related_model, foreign_key):
+    '''
+    Подзапрос, считающий связанные строки для каждой записи.
+    '''
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0,
+    )
+
+
+def drifted(model, field, related_model, foreign_key):
+    '''
+    Записи, у которых сохранённый счётчик расходится с фактическим.
+    '''
+    return model.objects.alias(
+        actual=actual_count(related_model, foreign_key)
+    ).filter(~Q(**{field: F('actual')}))
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import Subscribe
+from .models import Recipe, TimelineEntry
+
+
+def order_after(queryset, position, reverse, date_field='pub_date',
+                id_field='id'):
+    '''
+    Упорядочивает по (-дата, -id), а при reverse — в обратную
+    сторону, и оставляет записи после ключа position.
+    '''
+    if reverse:
+        queryset = queryset.order_by(date_field, id_field)
+    else:
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+    if position is None:
+        return queryset
+    pub_date, pk = position
+    compare = 'gt' if reverse else 'lt'
+    # Условие по одной дате избыточно, но задаёт границу, по которой
+    # планировщик выбирает проход по индексу (дата, id), а не по
+    # всей таблице, как для одного OR.
+    return queryset.filter(
+        Q(**{f'{date_field}__{compare}e': pub_date}),
+        Q(**{f'{date_field}__{compare}': pub_date})
+        | Q(**{date_field: pub_date, f'{id_field}__{compare}': pk}),
+    )
+
+
+def feed_keys(user_id, position, reverse, count):
+    '''
+    Ключи (дата, id рецепта) следующих count рецептов ленты.
+    Разложенные рецепты читаются из ленты пользователя, рецепты
+    популярных авторов — из рецептов его подписок.
+    '''
+    entries = order_after(
+        TimelineEntry.objects.filter(user_id=user_id),
+        position, reverse, id_field='recipe_id',
+    ).values_list('pub_date', 'recipe_id')[:count]
+    on_read = order_after(
+        Recipe.objects.filter(
+            fanned_out=False,
+            author__in=Subscribe.objects.filter(
+                subscriber_id=user_id
+            ).values('author'),
+        ),
+        position, reverse,
+    ).values_list('pub_date', 'id')[:count]
+    return sorted({*entries, *on_read}, reverse=not reverse)[:count]
+
+
+def subscribers_to_fan_out(author_id):
+    '''
+    Подписчики автора, если их не больше FEED_FANOUT_LIMIT,
+    иначе None: ленты популярных авторов собираются при чтении,
+    чтобы публикация рецепта не писала неограниченно много строк.
+    '''
+    limit = settings.FEED_FANOUT_LIMIT
+    subscribers = list(Subscribe.objects.filter(
+        author_id=author_id
+    ).values_list('subscriber_id', flat=True)[:limit + 1])
+    return None if len(subscribers) > limit else subscribers
+
+
+def fan_out(recipe, subscribers):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+            )
+            for user_id in subscribers
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(subscriber_id, author_id):
+    '''
+    Добавляет в ленту нового подписчика разложенные рецепты автора.
+    '''
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=subscriber_id, recipe_id=pk, pub_date=pub_date
+            )
+            for pk, pub_date in Recipe.objects.filter(
+                author_id=author_id, fanned_out=True
+            ).values_list('id', 'pub_date')
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def prune(subscriber_id, author_id):
+    '''
+    Убирает рецепты автора из ленты отписавшегося пользователя.
+    '''
+    TimelineEntry.objects.filter(
+        user_id=subscriber_id, recipe__author_id=author_id
+    ).delete()
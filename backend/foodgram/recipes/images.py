@@ -0,0 +1,123 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .models import Recipe
+from .versions import bump_response_versions
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'recipes/images/derivatives'
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+WEBP_QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_DERIVATIVES_WORKERS,
+    thread_name_prefix='image-derivatives',
+)
+
+
+def derivative_name(name, variant):
+    path = PurePosixPath(name)
+    extension = path.suffix.lstrip('.')
+    return f'{DERIVATIVES_DIR}/{path.stem}_{extension}_{variant}.webp'
+
+
+def render_variants(image_file):
+    '''
+    Уменьшает изображение до размеров всех вариантов
+    и кодирует их в WebP.
+    '''
+    with Image.open(image_file) as image:
+        image.load()
+        mode = 'RGBA' if 'A' in image.getbands() else 'RGB'
+        image = image.convert(mode)
+        rendered = {}
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+            rendered[variant] = buffer.getvalue()
+        return rendered
+
+
+def generate_derivatives(name, storage=default_storage):
+    '''
+    Создаёт производные изображения для файла name в хранилище.
+    Возвращает словарь {'source': name, вариант: имя файла}
+    или пустой словарь, если файл не удалось прочитать.
+    '''
+    try:
+        with storage.open(name) as image_file:
+            rendered = render_variants(image_file)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('Не удалось обработать изображение %s', name)
+        return {}
+    derivatives = {'source': name}
+    for variant, content in rendered.items():
+        target = derivative_name(name, variant)
+        if storage.exists(target):
+            storage.delete(target)
+        derivatives[variant] = storage.save(target, ContentFile(content))
+    return derivatives
+
+
+def delete_derivatives(derivatives, keep=(), storage=default_storage):
+    '''
+    Удаляет файлы копий из словаря derivatives, кроме имён из keep.
+    '''
+    for variant, name in derivatives.items():
+        if variant != 'source' and name not in keep and storage.exists(name):
+            storage.delete(name)
+
+
+def update_derivatives(recipe_id, name, old_derivatives):
+    '''
+    Создаёт копии изображения name рецепта и удаляет копии прежнего
+    изображения. Если изображение успели заменить ещё раз, новые
+    копии удаляются: их создаст следующий вызов.
+    '''
+    derivatives = generate_derivatives(name)
+    recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+    if derivatives and not recipes.update(
+        image_derivatives=derivatives, updated_at=timezone.now()
+    ):
+        delete_derivatives(derivatives)
+        return
+    delete_derivatives(old_derivatives, keep=set(derivatives.values()))
+    if derivatives:
+        bump_response_versions(recipes.version_names())
+
+
+def update_derivatives_in_background(*args):
+    try:
+        update_derivatives(*args)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения')
+    finally:
+        connection.close()
+
+
+def schedule_derivatives(recipe_id, name, old_derivatives):
+    '''
+    После фиксации транзакции создаёт копии изображения рецепта
+    в фоновом потоке, не задерживая ответ на запрос.
+    Рецепты, чьи копии не успели создаться, например из-за
+    перезапуска процесса, досоздаёт build_image_derivatives.
+    '''
+    transaction.on_commit(lambda: executor.submit(
+        update_derivatives_in_background, recipe_id, name, old_derivatives
+    ))
@@ -0,0 +1,176 @@
+from django.db import connections, router, transaction
+
+from .counters import LINK_COUNTERS, change_counter
+from .models import Recipe, ShoppingCart, ShoppingListItem
+from .versions import bump_version, membership_version_name
+
+
+def insert_columns(model, connection):
+    fields = [
+        field for field in model._meta.concrete_fields
+        if field is not model._meta.auto_field
+    ]
+    return fields, ', '.join(
+        connection.ops.quote_name(field.column) for field in fields
+    )
+
+
+def insert_values(instance, fields, connection):
+    return [
+        field.get_db_prep_save(field.pre_save(instance, add=True), connection)
+        for field in fields
+    ]
+
+
+def insert_ignore(instance, parent):
+    '''
+    Вставляет строку одним запросом INSERT ... SELECT ... WHERE EXISTS.
+    Строка пропускается, если нарушает ограничение уникальности
+    или если родительской записи parent (queryset) нет.
+    Возвращает True, если строка вставлена.
+    '''
+    model = type(instance)
+    connection = connections[router.db_for_write(model)]
+    fields, columns = insert_columns(model, connection)
+    values = insert_values(instance, fields, connection)
+    parent_sql, parent_params = parent.values('pk').query.sql_with_params()
+    ops = connection.ops
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{ops.quote_name(model._meta.db_table)} ({columns}) '
+        f'SELECT {", ".join(["%s"] * len(values))} '
+        f'WHERE EXISTS ({parent_sql})'
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*values, *parent_params])
+        return cursor.rowcount == 1
+
+
+def insert_links(model, user_id, recipe_ids):
+    '''
+    Вставляет связи пользователя с рецептами, пропуская уже
+    существующие. Возвращает id рецептов, строки которых вставил
+    именно этот вызов, поэтому параллельная вставка тех же строк
+    не будет учтена дважды. Если БД умеет RETURNING, вставка идёт
+    одним INSERT ... ON CONFLICT DO NOTHING RETURNING, иначе —
+    по строке через insert_ignore.
+    '''
+    if not recipe_ids:
+        return []
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        return [
+            pk for pk in recipe_ids
+            if insert_ignore(
+                model(user_id=user_id, recipe_id=pk),
+                Recipe.objects.filter(pk=pk),
+            )
+        ]
+    fields, columns = insert_columns(model, connection)
+    params = []
+    for pk in recipe_ids:
+        params.extend(insert_values(
+            model(user_id=user_id, recipe_id=pk), fields, connection
+        ))
+    ops = connection.ops
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    recipe_column = model._meta.get_field('recipe').column
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{ops.quote_name(model._meta.db_table)} ({columns}) '
+        f'VALUES {", ".join([placeholders] * len(recipe_ids))}'
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)} '
+        f'RETURNING {ops.quote_name(recipe_column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        inserted = {row[0] for row in cursor.fetchall()}
+    return [pk for pk in recipe_ids if pk in inserted]
+
+
+def delete_rows(queryset):
+    '''
+    Удаляет строки queryset одним DELETE и возвращает их число.
+    В отличие от QuerySet.delete() строки не загружаются,
+    а сигналы и каскады не срабатывают: годится только для
+    таблиц, на которые нет внешних ключей, а работу сигналов
+    (счётчики, списки покупок, версии) вызывающий код делает сам.
+    Единственное место, где используется QuerySet._raw_delete.
+    '''
+    return queryset._raw_delete(queryset.db)
+
+
+def add_link(model, user_id, recipe_id):
+    '''
+    Добавляет рецепт в избранное или корзину одним запросом,
+    не падая на повторном добавлении. Возвращает True,
+    если рецепт добавлен.
+    '''
+    with transaction.atomic():
+        added = insert_ignore(
+            model(user_id=user_id, recipe_id=recipe_id),
+            Recipe.objects.filter(pk=recipe_id),
+        )
+        if added:
+            links_changed(model, user_id, [recipe_id], 1)
+    return added
+
+
+def remove_link(model, user_id, recipe_id):
+    '''
+    Убирает рецепт из избранного или корзины одним DELETE.
+    Возвращает True, если рецепт был там.
+    '''
+    with transaction.atomic():
+        links = model.objects.filter(user_id=user_id, recipe_id=recipe_id)
+        removed = delete_rows(links) > 0
+        if removed:
+            links_changed(model, user_id, [recipe_id], -1)
+    return removed
+
+
+def add_links(model, user_id, recipe_ids):
+    '''
+    Добавляет рецепты в избранное или корзину пользователя через
+    insert_links. Сигналы при этом не срабатывают, поэтому счётчики,
+    список покупок и версия пользователя обновляются здесь же —
+    только для строк, вставленных этим вызовом. recipe_ids не должны
+    повторяться: их проверяет RecipeIdsSerializer.
+    Возвращает id добавленных рецептов.
+    '''
+    with transaction.atomic():
+        added = insert_links(model, user_id, list(recipe_ids))
+        links_changed(model, user_id, added, 1)
+    return added
+
+
+def remove_links(model, user_id, recipe_ids=None):
+    '''
+    Убирает рецепты из избранного или корзины одним DELETE,
+    без recipe_ids — все рецепты пользователя.
+    Возвращает id убранных рецептов.
+    '''
+    with transaction.atomic():
+        links = model.objects.filter(user_id=user_id)
+        if recipe_ids is not None:
+            links = links.filter(recipe_id__in=recipe_ids)
+        removed = list(
+            links.select_for_update().values_list('recipe_id', flat=True)
+        )
+        if removed:
+            # Удаление без сигналов: их работа сделана в links_changed.
+            delete_rows(links)
+            links_changed(model, user_id, removed, -1)
+    return removed
+
+
+def links_changed(model, user_id, recipe_ids, sign):
+    if not recipe_ids:
+        return
+    change_counter(
+        Recipe.objects.filter(pk__in=recipe_ids), LINK_COUNTERS[model], sign
+    )
+    if model is ShoppingCart:
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids, sign)
+    bump_version(membership_version_name(user_id))
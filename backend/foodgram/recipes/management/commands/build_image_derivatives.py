@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from recipes.images import delete_derivatives, generate_derivatives
+from recipes.models import Recipe
+from recipes.versions import bump_response_versions
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """
+    Создание уменьшенных копий изображений существующих рецептов.
+    Запуск производится командой
+    python manage.py build_image_derivatives [--workers 4] [--force]
+    Изображения обрабатываются параллельно в пуле процессов.
+    """
+    help = 'Создаёт WebP-копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов обработки.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии, даже если они актуальны.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = [
+            recipe for recipe in Recipe.objects.exclude(image='').only(
+                'id', 'image', 'image_derivatives', 'updated_at'
+            ).iterator()
+            if options['force'] or not recipe.has_fresh_derivatives
+        ]
+        self.stdout.write(f'Рецептов к обработке: {len(recipes)}')
+        if not recipes:
+            return
+        names = sorted({recipe.image.name for recipe in recipes})
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            derivatives = dict(zip(
+                names,
+                pool.map(generate_derivatives, names, chunksize=16),
+            ))
+        failed = sum(not result for result in derivatives.values())
+        new_names = {
+            name for result in derivatives.values()
+            for name in result.values()
+        }
+        now = timezone.now()
+        for start in range(0, len(recipes), BATCH_SIZE):
+            batch = recipes[start:start + BATCH_SIZE]
+            for recipe in batch:
+                delete_derivatives(recipe.image_derivatives, keep=new_names)
+                recipe.image_derivatives = derivatives[recipe.image.name]
+                recipe.updated_at = now
+            # bulk_update не вызывает сигналов: ответы с прежними
+            # адресами изображений сбрасываются здесь.
+            Recipe.objects.bulk_update(
+                batch, ['image_derivatives', 'updated_at']
+            )
+            bump_response_versions(Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in batch]
+            ).version_names())
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений обработано: {len(names) - failed}, '
+            f'с ошибками: {failed}'
+        ))
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from recipes.models import IngredientAmountInRecipe, Recipe, RecipeNeighbour
+from recipes.similarity import (
+    METRICS,
+    ingredient_matrix,
+    rows_of,
+    similarities,
+    top_neighbours
+)
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт похожих рецептов по пересечению ингредиентов.
+    Запуск производится командой python manage.py build_similar_recipes
+    По умолчанию пересчитываются рецепты с изменёнными ингредиентами
+    и рецепты, чьи соседи из-за этих изменений могли смениться.
+    С флагом --full пересчитываются все рецепты.
+    """
+    help = 'Пересчитывает таблицу похожих рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты.',
+        )
+        parser.add_argument(
+            '--metric',
+            choices=METRICS,
+            default='jaccard',
+            help='Мера сходства наборов ингредиентов.',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=settings.SIMILAR_RECIPES_COUNT,
+            help='Число похожих рецептов у каждого рецепта.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Число рецептов, пересчитываемых за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        recipe_ids, matrix = ingredient_matrix(
+            IngredientAmountInRecipe.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ).iterator()
+        )
+        if options['full']:
+            stale = set(Recipe.objects.values_list('id', flat=True))
+            affected = stale
+        else:
+            stale = set(Recipe.objects.filter(
+                similarity_stale=True
+            ).values_list('id', flat=True))
+            affected = self.affected(
+                recipe_ids, matrix, stale, options['metric'], options['top']
+            )
+        affected = sorted(affected)
+        size = options['chunk_size']
+        for start in range(0, len(affected), size):
+            self.rebuild(
+                recipe_ids, matrix, affected[start:start + size],
+                options['metric'], options['top'],
+            )
+        # Рецепты, изменённые во время пересчёта, остаются устаревшими:
+        # флаг ставится вместе с новым временем изменения.
+        done = Recipe.objects.filter(
+            similarity_stale=True, updated_at__lte=started
+        )
+        if not options['full']:
+            done = done.filter(pk__in=stale)
+        done.update(similarity_stale=False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {len(affected)}'
+        ))
+
+    def affected(self, recipe_ids, matrix, stale, metric, top):
+        '''
+        Кроме изменённых рецептов пересчитываются те, у кого
+        изменённый рецепт был соседом или теперь обгоняет
+        худшего из соседей.
+        '''
+        affected = set(stale)
+        affected.update(RecipeNeighbour.objects.filter(
+            neighbour_id__in=stale
+        ).values_list('recipe_id', flat=True))
+        rows = rows_of(recipe_ids, stale)
+        if not len(rows):
+            return affected
+        scores = similarities(matrix, rows, metric).tocoo()
+        candidates = recipe_ids[scores.col]
+        worst = {
+            recipe_id: (count, score)
+            for recipe_id, count, score in RecipeNeighbour.objects.filter(
+                recipe_id__in=set(candidates.tolist()) - affected
+            ).values('recipe_id').annotate(
+                count=Count('id'), score=Min('score')
+            ).values_list('recipe_id', 'count', 'score')
+        }
+        for recipe_id, score in zip(candidates.tolist(), scores.data):
+            if recipe_id in affected:
+                continue
+            count, worst_score = worst.get(recipe_id, (0, 0))
+            if count < top or score > worst_score:
+                affected.add(recipe_id)
+        return affected
+
+    def rebuild(self, recipe_ids, matrix, chunk, metric, top):
+        rows = rows_of(recipe_ids, chunk)
+        neighbours = []
+        if len(rows):
+            scores = similarities(matrix, rows, metric)
+            for row, columns, values in top_neighbours(scores, rows, top):
+                neighbours.extend(
+                    RecipeNeighbour(
+                        recipe_id=int(recipe_ids[row]),
+                        neighbour_id=int(recipe_ids[column]),
+                        score=float(value),
+                    )
+                    for column, value in zip(columns, values)
+                )
+        with transaction.atomic():
+            RecipeNeighbour.objects.filter(recipe_id__in=chunk).delete()
+            RecipeNeighbour.objects.bulk_create(neighbours, batch_size=1000)
@@ -0,0 +1,47 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.counters import COUNTERS, actual_count, drifted
+
+
+class Command(BaseCommand):
+    """
+    Проверка счётчиков избранного, корзин, ингредиентов рецепта
+    и рецептов автора.
+    Запуск производится командой python manage.py check_counters
+    С флагом --fix расходящиеся счётчики пересчитываются
+    одним UPDATE на каждый счётчик.
+    """
+    help = 'Сверяет денормализованные счётчики с фактическими данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Исправить найденные расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for model, field, related_model, foreign_key in COUNTERS:
+                queryset = drifted(model, field, related_model, foreign_key)
+                if options['fix']:
+                    count = queryset.update(
+                        **{field: actual_count(related_model, foreign_key)}
+                    )
+                else:
+                    count = queryset.count()
+                total += count
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'расхождений {count}'
+                )
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS('Расхождения исправлены'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения, для исправления запустите с --fix'
+            ))
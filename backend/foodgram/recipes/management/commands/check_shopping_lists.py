@@ -0,0 +1,83 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Проверка сводных списков покупок на расхождение с корзинами.
+    Запуск производится командой python manage.py check_shopping_lists
+    С флагом --fix найденные расхождения исправляются.
+    """
+    help = 'Пересчитывает сводные списки покупок и сообщает о расхождениях.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Исправить найденные расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            missing, extra, wrong = self.find_drift()
+            self.stdout.write(
+                f'Отсутствует позиций: {len(missing)}\n'
+                f'Лишних позиций: {len(extra)}\n'
+                f'Неверное количество: {len(wrong)}'
+            )
+            if not (missing or extra or wrong):
+                self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+                return
+            if not options['fix']:
+                self.stdout.write(self.style.WARNING(
+                    'Найдены расхождения, для исправления запустите с --fix'
+                ))
+                return
+            ShoppingListItem.objects.bulk_create(
+                missing, batch_size=BATCH_SIZE
+            )
+            ShoppingListItem.objects.bulk_update(
+                wrong, ['amount'], batch_size=BATCH_SIZE
+            )
+            for start in range(0, len(extra), BATCH_SIZE):
+                ShoppingListItem.objects.filter(
+                    pk__in=extra[start:start + BATCH_SIZE]
+                ).delete()
+        self.stdout.write(self.style.SUCCESS('Расхождения исправлены'))
+
+    def find_drift(self):
+        '''
+        Сравнивает слиянием два упорядоченных потока: пересчитанный
+        с нуля список и сохранённые позиции.
+        '''
+        expected = iter(ShoppingListItem.objects.expected().iterator())
+        actual = iter(
+            ShoppingListItem.objects.select_for_update().order_by(
+                'user_id', 'ingredient_id'
+            ).iterator()
+        )
+        missing, extra, wrong = [], [], []
+        row, item = next(expected, None), next(actual, None)
+        while row is not None or item is not None:
+            row_key = row and (row['user_id'], row['ingredient_id'])
+            item_key = item and (item.user_id, item.ingredient_id)
+            if item is None or (row is not None and row_key < item_key):
+                missing.append(ShoppingListItem(
+                    user_id=row['user_id'],
+                    ingredient_id=row['ingredient_id'],
+                    amount=row['total'],
+                ))
+                row = next(expected, None)
+            elif row is None or item_key < row_key:
+                extra.append(item.pk)
+                item = next(actual, None)
+            else:
+                if item.amount != row['total']:
+                    item.amount = row['total']
+                    wrong.append(item)
+                row, item = next(expected, None), next(actual, None)
+        return missing, extra, wrong
@@ -1,31 +1,133 @@
 import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
 from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+DEFAULT_PATH = Path(settings.BASE_DIR) / 'static' / 'data' / 'ingredients.csv'
+FORMATS = ('csv', 'json')
 
 
 class Command(BaseCommand):
     """
-    Скрипт импорта мок-данных из файла .csv в БД.
-    Запуск производится командой python manage.py import_csv
-    Заполнить базу можно только один раз.
-    Для повторного запуска необходимо удалить файлы БД.
+    Скрипт импорта ингредиентов из файла .csv или .json в БД.
+    Запуск производится командой python manage.py import_csv [путь]
+    Импорт можно запускать повторно: уже существующие ингредиенты
+    пропускаются. На PostgreSQL строки загружаются через COPY
+    во временную таблицу, на остальных СУБД — через bulk_create.
     """
-    def handle(self, *args, **kwargs):
-        model = Ingredient
-        with open(
-            f'{settings.BASE_DIR}/static/data/ingredients.csv',
-            newline='',
-            encoding='utf-8'
-        ) as csv_file:
-            reader = csv.reader(csv_file)
-            count = 0
-            for row in reader:
-                name, unit = row
-                model.objects.get_or_create(name=name,
-                                            measurement_unit=unit)
-                count += 1
-                print(f'Обработано: {count} записей.')
+    help = 'Импортирует ингредиенты из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+
+        self.total = self.duplicates = self.invalid = 0
+        self.seen = set()
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = self.unique(
+                self.read_csv(file) if file_format == 'csv'
+                else self.read_json(file)
+            )
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    inserted = self.copy(rows)
+                else:
+                    inserted = self.bulk_insert(rows, options['batch_size'])
+        bump_version('ingredients')
 
+        self.stdout.write(
+            f'Обработано строк: {self.total}\n'
+            f'Добавлено: {inserted}\n'
+            f'Уже были в БД: {len(self.seen) - inserted}\n'
+            f'Дубликаты в файле: {self.duplicates}\n'
+            f'Некорректные строки: {self.invalid}'
+        )
         self.stdout.write(self.style.SUCCESS('Данные загружены'))
+
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            self.total += 1
+            if len(row) != 2:
+                self.invalid += 1
+                continue
+            yield row
+
+    def read_json(self, file):
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Некорректный JSON: {error}')
+        for item in data:
+            self.total += 1
+            try:
+                row = item['name'], item['measurement_unit']
+            except (KeyError, TypeError):
+                row = None
+            if row is None or not all(isinstance(value, str) for value in row):
+                self.invalid += 1
+                continue
+            yield row
+
+    def unique(self, rows):
+        for name, unit in rows:
+            key = (name.strip(), unit.strip())
+            if not all(key):
+                self.invalid += 1
+            elif key in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen.add(key)
+                yield key
+
+    def bulk_insert(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        rows = iter(rows)
+        while batch := list(islice(rows, batch_size)):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+        return Ingredient.objects.count() - before
+
+    def copy(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
@@ -0,0 +1,341 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, models, transaction
+
+from recipes.counters import COUNTERS
+from recipes.models import (
+    Favourite,
+    Ingredient,
+    IngredientAmountInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag
+)
+from users.models import Subscribe, User
+
+START_DATE = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PLACEHOLDER_IMAGE = 'recipes/images/temp.png'
+PASSWORD = 'load-test-password'
+
+
+def zipf_weights(count, exponent):
+    '''
+    Накопленные веса степенного распределения для random.choices.
+    '''
+    return list(accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)
+    ))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_dates(model):
+    '''
+    Отключает auto_now_add, чтобы сохранить заданные даты.
+    '''
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетических данных для нагрузочного тестирования.
+    Запуск производится командой
+    python manage.py seed_load_data --users 10000 --recipes 100000
+    При одинаковом --seed данные получаются одинаковыми.
+    На PostgreSQL строки загружаются через COPY, на остальных
+    СУБД — через bulk_create пачками.
+    """
+    help = 'Заполняет БД пользователями, рецептами и связями между ними.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте.',
+        )
+        parser.add_argument(
+            '--favourites', type=int, default=20,
+            help='Среднее число рецептов в избранном пользователя.',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в корзине пользователя.',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного распределения популярности.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.prefix = f'load{options["seed"]}'
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Данные с seed={options["seed"]} уже загружены.'
+            )
+        with transaction.atomic():
+            tag_ids = self.stage('Теги', self.create_tags)
+            ingredient_ids = self.stage('Ингредиенты', self.get_ingredients)
+            user_ids = self.stage('Пользователи', self.create_users)
+            self.author_weights = zipf_weights(len(user_ids), options['skew'])
+            self.authors = self.rng.sample(user_ids, len(user_ids))
+            recipe_ids = self.stage(
+                'Рецепты', self.create_recipes, self.authors
+            )
+            self.stage(
+                'Теги рецептов', self.create_recipe_tags, recipe_ids, tag_ids
+            )
+            self.stage(
+                'Ингредиенты рецептов', self.create_recipe_ingredients,
+                recipe_ids, ingredient_ids,
+            )
+            popular_recipes = self.rng.sample(recipe_ids, len(recipe_ids))
+            recipe_weights = zipf_weights(len(recipe_ids), options['skew'])
+            self.stage(
+                'Избранное', self.create_links, Favourite, user_ids,
+                popular_recipes, recipe_weights, options['favourites'],
+            )
+            self.stage(
+                'Корзины', self.create_links, ShoppingCart, user_ids,
+                popular_recipes, recipe_weights, options['cart'],
+            )
+            self.stage('Подписки', self.create_subscriptions, user_ids)
+            self.stage('Списки покупок', self.rebuild_aggregates)
+            self.stage('Счётчики', self.rebuild_counters)
+        self.stdout.write(self.style.SUCCESS('Данные загружены'))
+
+    def stage(self, title, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(
+            f'{title}: {count} ({time.perf_counter() - started:.1f} с)'
+        )
+        return result
+
+    def insert(self, model, objects):
+        count = 0
+        for batch in batched(objects, self.options['batch_size']):
+            if self.use_copy:
+                self.copy(model, batch)
+            else:
+                model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def copy(self, model, objects):
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not isinstance(field, models.AutoField)
+        ]
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write('\t'.join(
+                self.copy_value(field, obj) for field in fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {table} ({columns}) FROM STDIN', buffer
+            )
+
+    def copy_value(self, field, obj):
+        value = field.get_db_prep_save(
+            field.pre_save(obj, add=True), connection
+        )
+        if value is None:
+            return r'\N'
+        return (
+            str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r')
+        )
+
+    def create_tags(self):
+        used_colors = set(Tag.objects.values_list('color', flat=True))
+        colors = (
+            f'#{color:06x}' for color in self.rng.sample(range(16 ** 6), 1000)
+        )
+        colors = (color for color in colors if color not in used_colors)
+        self.insert(Tag, (
+            Tag(
+                name=f'{self.prefix} тег {number}',
+                slug=f'{self.prefix}-{number}',
+                color=next(colors),
+            ) for number in range(self.options['tags'])
+        ))
+        return list(Tag.objects.filter(
+            slug__startswith=self.prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def get_ingredients(self):
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if ingredient_ids:
+            return ingredient_ids
+        self.insert(Ingredient, (
+            Ingredient(name=f'{self.prefix} ингредиент {number}',
+                       measurement_unit='г')
+            for number in range(2000)
+        ))
+        return list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        count = self.options['users']
+        self.insert(User, (
+            User(
+                username=f'{self.prefix}_{number:08d}',
+                email=f'{self.prefix}_{number:08d}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+                date_joined=START_DATE + timedelta(minutes=number),
+            ) for number in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=self.prefix
+        ).order_by('username').values_list('id', flat=True))
+
+    def create_recipes(self, authors):
+        count = self.options['recipes']
+        seconds = 365 * 24 * 3600
+        offsets = sorted(self.rng.randrange(seconds) for _ in range(count))
+        author_ids = self.rng.choices(
+            authors, cum_weights=self.author_weights, k=count
+        )
+        with explicit_dates(Recipe):
+            self.insert(Recipe, (
+                Recipe(
+                    author_id=author_id,
+                    name=f'{self.prefix} рецепт {number}',
+                    image=PLACEHOLDER_IMAGE,
+                    text=f'Описание рецепта {number}',
+                    cooking_time=self.rng.randint(5, 180),
+                    pub_date=START_DATE + timedelta(seconds=offset),
+                ) for number, (author_id, offset) in enumerate(
+                    zip(author_ids, offsets)
+                )
+            ))
+        return list(Recipe.objects.filter(
+            name__startswith=self.prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipe_tags(self, recipe_ids, tag_ids):
+        through = Recipe.tags.through
+        return self.insert(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, min(len(tag_ids), self.rng.randint(1, 3))
+            )
+        ))
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids):
+        popular = self.rng.sample(ingredient_ids, len(ingredient_ids))
+        weights = zipf_weights(len(popular), self.options['skew'])
+        mean = self.options['ingredients_per_recipe']
+
+        def ingredients(recipe_id):
+            count = min(len(popular), max(1, int(self.rng.gauss(mean, 3))))
+            chosen = set()
+            while len(chosen) < count:
+                chosen.update(self.rng.choices(
+                    popular, cum_weights=weights, k=count - len(chosen)
+                ))
+            return sorted(chosen)
+
+        return self.insert(IngredientAmountInRecipe, (
+            IngredientAmountInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 1000),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in ingredients(recipe_id)
+        ))
+
+    def sample_count(self, mean, limit):
+        return min(limit, int(self.rng.expovariate(1 / mean))) if mean else 0
+
+    def create_links(self, model, user_ids, recipes, weights, mean):
+        def links(user_id):
+            count = self.sample_count(mean, len(recipes))
+            return set(self.rng.choices(recipes, cum_weights=weights, k=count))
+
+        return self.insert(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in sorted(links(user_id))
+        ))
+
+    def create_subscriptions(self, user_ids):
+        mean = self.options['subscriptions']
+
+        def authors(user_id):
+            count = self.sample_count(mean, len(self.authors) - 1)
+            chosen = set(self.rng.choices(
+                self.authors, cum_weights=self.author_weights, k=count
+            ))
+            chosen.discard(user_id)
+            return sorted(chosen)
+
+        return self.insert(Subscribe, (
+            Subscribe(subscriber_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in authors(user_id)
+        ))
+
+    def rebuild_aggregates(self):
+        call_command('check_shopping_lists', fix=True, stdout=io.StringIO())
+        return ShoppingListItem.objects.count()
+
+    def rebuild_counters(self):
+        call_command('check_counters', fix=True, stdout=io.StringIO())
+        return len(COUNTERS)
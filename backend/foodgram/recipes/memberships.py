@@ -0,0 +1,69 @@
+from array import array
+
+from django.core.cache import cache
+from django.db import models
+
+from foodgram.metrics import record_cache
+from users.models import Subscribe
+from .models import Favourite, ShoppingCart
+from .versions import get_version, membership_version_name
+
+MEMBERSHIPS_KEY = 'memberships:{}:{}'
+FAVOURITES, CART, SUBSCRIPTIONS = range(3)
+
+
+class Memberships:
+    '''
+    Избранное, корзина и подписки пользователя: множества id
+    рецептов и авторов для проверки за O(1). В кэше хранятся
+    компактными массивами целых чисел.
+    '''
+
+    def __init__(self, favourites=(), cart=(), subscriptions=()):
+        self.favourites = frozenset(favourites)
+        self.cart = frozenset(cart)
+        self.subscriptions = frozenset(subscriptions)
+
+    @classmethod
+    def load(cls, user_id):
+        '''
+        Загружает все три множества одним запросом.
+        '''
+        sets = ([], [], [])
+        rows = Favourite.objects.filter(user_id=user_id).values_list(
+            models.Value(FAVOURITES), 'recipe_id'
+        ).union(
+            ShoppingCart.objects.filter(user_id=user_id).values_list(
+                models.Value(CART), 'recipe_id'
+            ),
+            Subscribe.objects.filter(subscriber_id=user_id).values_list(
+                models.Value(SUBSCRIPTIONS), 'author_id'
+            ),
+            all=True,
+        )
+        for kind, pk in rows:
+            sets[kind].append(pk)
+        return cls(*sets)
+
+    def pack(self):
+        return tuple(
+            array('q', sorted(ids))
+            for ids in (self.favourites, self.cart, self.subscriptions)
+        )
+
+
+def get_memberships(user_id):
+    '''
+    Членства пользователя из кэша. Записи в избранное, корзину
+    и подписки меняют версию пользователя, и при следующем чтении
+    множества загружаются заново.
+    '''
+    token = get_version(membership_version_name(user_id))[0]
+    key = MEMBERSHIPS_KEY.format(user_id, token)
+    packed = cache.get(key)
+    record_cache('memberships', packed is not None)
+    if packed is None:
+        memberships = Memberships.load(user_id)
+        cache.set(key, memberships.pack())
+        return memberships
+    return Memberships(*packed)
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.20 on 2026-10-18 06:42
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(related_model, foreign_key):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    Recipe.objects.update(
+        favourites_count=count(apps.get_model('recipes', 'Favourite'),
+                               'recipe'),
+        in_cart_count=count(apps.get_model('recipes', 'ShoppingCart'),
+                            'recipe'),
+    )
+    User.objects.update(recipes_count=count(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_updated_at'),
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favourites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Раз в избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Раз в корзине'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from collections import defaultdict
+
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, NullIf, RowNumber
+from django.utils import timezone
 
 from foodgram.global_constants import (
     COLOR_NAME_LENGTH,
@@ -8,7 +12,9 @@ from foodgram.global_constants import (
     RECIPE_NAME_LENGTH, SLUG_LENGTH,
     TAG_NAME_LENGTH
 )
+from foodgram.mixins import UpdateOnlyFieldsMixin
 from users.models import User
+from .versions import recipe_version_names
 
 
 class Tag(models.Model):
@@ -78,7 +84,85 @@ class Ingredient(models.Model):
         return f'{self.name} в {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    '''
+    Набор запросов рецептов с данными для сериализации.
+    '''
+    def with_relations(self):
+        '''
+        Подгружает автора, теги и ингредиенты рецептов
+        фиксированным числом запросов.
+        '''
+        return self.prefetch_related(
+            'author',
+            'tags',
+            models.Prefetch(
+                'ingredient_list',
+                queryset=IngredientAmountInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def by_pantry(self, ingredient_ids, max_missing=None):
+        '''
+        Рецепты хотя бы с одним из ингредиентов: сколько ингредиентов
+        найдено, сколько не хватает и какая доля рецепта покрыта.
+        Считается одним проходом по индексу ингредиентов в рецептах
+        с группировкой по рецепту, от лучше покрытых к хуже.
+        '''
+        recipes = self.filter(
+            ingredient_list__ingredient_id__in=ingredient_ids
+        ).annotate(
+            matched=models.Count('ingredient_list'),
+        ).annotate(
+            missing=models.F('ingredients_count') - models.F('matched'),
+            coverage=Cast('matched', models.FloatField()) / NullIf(
+                'ingredients_count', 0
+            ),
+        )
+        if max_missing is not None:
+            recipes = recipes.filter(missing__lte=max_missing)
+        return recipes.order_by('-coverage', 'missing', '-pub_date', '-id')
+
+    def touch(self):
+        '''
+        Отмечает рецепты изменёнными.
+        '''
+        return self.update(updated_at=timezone.now())
+
+    def version_names(self):
+        '''
+        Версии кэша ответов, которые меняются вместе с рецептами
+        набора: сами рецепты и списки, где они могут оказаться.
+        '''
+        names = set()
+        rows = self.order_by().values_list('id', 'author_id', 'tags__slug')
+        for recipe_id, author_id, slug in rows:
+            names.update(recipe_version_names(
+                recipe_id, author_id, [slug] if slug else []
+            ))
+        return names
+
+    def top_per_author(self, limit):
+        '''
+        Возвращает не более limit последних рецептов каждого автора
+        одним запросом с ранжированием оконной функцией.
+        '''
+        ranked = self.annotate(author_rank=models.Window(
+            expression=RowNumber(),
+            partition_by=models.F('author_id'),
+            order_by=(models.F('pub_date').desc(), models.F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE author_rank <= %s '
+            'ORDER BY author_id, author_rank',
+            (*params, limit),
+        )
+
+
+class Recipe(UpdateOnlyFieldsMixin, models.Model):
     '''
     Реализация модели рецепта.
     '''
@@ -125,15 +209,89 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    image_derivatives = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    favourites_count = models.PositiveIntegerField(
+        verbose_name='Раз в избранном',
+        default=0,
+        editable=False,
+    )
+    in_cart_count = models.PositiveIntegerField(
+        verbose_name='Раз в корзине',
+        default=0,
+        editable=False,
+    )
+    ingredients_count = models.PositiveIntegerField(
+        verbose_name='Число ингредиентов',
+        default=0,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name='Разложен по лентам подписчиков',
+        default=False,
+        editable=False,
+    )
+    similarity_stale = models.BooleanField(
+        verbose_name='Похожие рецепты устарели',
+        default=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    update_only_fields = (
+        'favourites_count', 'in_cart_count', 'ingredients_count',
+        'fanned_out', 'similarity_stale', 'image_derivatives',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_feed_on_read_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+            models.Index(
+                fields=['id'],
+                name='recipe_similarity_stale_idx',
+                condition=models.Q(similarity_stale=True),
+            ),
+        ]
 
     def __str__(self):
         return f'Рецепт {self.name}'
 
+    @property
+    def has_fresh_derivatives(self):
+        return (
+            bool(self.image)
+            and self.image_derivatives.get('source') == self.image.name
+        )
+
+    def image_variant_url(self, variant):
+        '''
+        Адрес уменьшенной копии изображения, а пока её нет — оригинала.
+        '''
+        if self.has_fresh_derivatives and variant in self.image_derivatives:
+            return self.image.storage.url(self.image_derivatives[variant])
+        return self.image.url if self.image else None
+
 
 class IngredientAmountInRecipe(models.Model):
     '''
@@ -164,6 +322,23 @@ class IngredientAmountInRecipe(models.Model):
             name='unique_IngredientAmountInRecipe')
         ]
 
+    # Поля, по которым сигналы переносят правку строки в списки покупок.
+    SAVED_FIELDS = ('recipe_id', 'ingredient_id', 'amount')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        '''
+        Запоминает загруженные значения строки, чтобы при сохранении
+        не читать старое количество из БД отдельным запросом.
+        '''
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if all(field in loaded for field in cls.SAVED_FIELDS):
+            instance.loaded_amount = tuple(
+                loaded[field] for field in cls.SAVED_FIELDS
+            )
+        return instance
+
     def __str__(self):
         return f'{self.ingredient} -\
             {self.amount} {self.ingredient.measurement_unit}'
@@ -233,3 +408,216 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил в корзину покупок {self.recipe}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    '''
+    Операции инкрементального обновления сводного списка покупок.
+    '''
+    def apply_changes(self, changes):
+        '''
+        Применяет изменения количества вида
+        {(id пользователя, id ингредиента): изменение}.
+        '''
+        changes = {key: delta for key, delta in changes.items() if delta}
+        if not changes:
+            return
+        user_ids = {user_id for user_id, _ in changes}
+        ingredient_ids = {ingredient_id for _, ingredient_id in changes}
+        with transaction.atomic():
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids,
+                    ingredient_id__in=ingredient_ids,
+                )
+            }
+            to_create, to_update, to_delete = [], [], []
+            for (user_id, ingredient_id), delta in changes.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        to_create.append(self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=delta,
+                        ))
+                    continue
+                item.amount += delta
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ['amount'])
+            if to_delete:
+                self.filter(pk__in=to_delete).delete()
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        '''
+        Добавляет в список покупок пользователя ингредиенты рецептов
+        (или убирает их при sign=-1).
+        '''
+        changes = defaultdict(int)
+        amounts = IngredientAmountInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'amount')
+        for ingredient_id, amount in amounts:
+            changes[(user_id, ingredient_id)] += sign * amount
+        self.apply_changes(changes)
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.add_recipes(user_id, recipe_ids, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        '''
+        Переносит изменение состава рецепта в списки покупок всех
+        пользователей, у которых рецепт лежит в корзине.
+        Состав передаётся словарями {id ингредиента: количество}.
+        '''
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        self.apply_changes({
+            (user_id, ingredient_id): delta
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items()
+        })
+
+    def expected(self):
+        '''
+        Сводный список покупок, посчитанный заново по корзинам,
+        упорядоченный по пользователю и ингредиенту.
+        '''
+        return IngredientAmountInRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False,
+        ).values(
+            'ingredient_id',
+            user_id=models.F('recipe__shopping_cart__user'),
+        ).annotate(
+            total=models.Sum('amount'),
+        ).order_by('user_id', 'ingredient_id')
+
+
+class ShoppingListItem(models.Model):
+    '''
+    Сводный список покупок пользователя: суммарное количество
+    каждого ингредиента из рецептов в корзине.
+    '''
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество/объем',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_shopping_list_item')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    '''
+    Рецепт в ленте подписок пользователя. Дата публикации
+    повторяет дату рецепта, чтобы лента читалась по индексу.
+    '''
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='timeline',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'],
+            name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class RecipeNeighbour(models.Model):
+    '''
+    Похожий рецепт по пересечению ингредиентов.
+    Заполняется командой build_similar_recipes.
+    '''
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='neighbours',
+        on_delete=models.CASCADE,
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('-score', 'neighbour_id')
+        constraints = [models.UniqueConstraint(
+            fields=['recipe', 'neighbour'],
+            name='unique_recipe_neighbour')
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='recipe_neighbour_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.neighbour} похож на {self.recipe}'
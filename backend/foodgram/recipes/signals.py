@@ -0,0 +1,322 @@
+import threading
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscribe, User
+from .counters import LINK_COUNTERS, change_counter
+from .feed import backfill, fan_out, prune, subscribers_to_fan_out
+from .images import schedule_derivatives
+from .models import (
+    Favourite,
+    Ingredient,
+    IngredientAmountInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag
+)
+from .versions import (
+    bump_response_versions,
+    bump_version,
+    membership_version_name,
+    recipe_version_names
+)
+
+
+# Рецепты, которые удаляются в текущем потоке. Строки их ингредиентов
+# удаляются каскадом, а ответы, списки покупок и счётчики обновляют
+# сигналы самого рецепта и корзин, поэтому сигналы строк пропускаются.
+deleting_recipes = threading.local()
+
+
+def recipe_deleting(recipe_id):
+    return recipe_id in getattr(deleting_recipes, 'ids', ())
+
+
+@receiver(pre_delete, sender=Recipe)
+def start_recipe_delete(sender, instance, **kwargs):
+    if not hasattr(deleting_recipes, 'ids'):
+        deleting_recipes.ids = set()
+    deleting_recipes.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def finish_recipe_delete(sender, instance, **kwargs):
+    deleting_recipes.ids.discard(instance.pk)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_link_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            LINK_COUNTERS[sender], 1,
+        )
+
+
+@receiver(post_delete, sender=Favourite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_link_counter(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        LINK_COUNTERS[sender], -1,
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_ingredients_version(sender, instance, **kwargs):
+    bump_version('ingredients')
+    bump_response_versions(['ingredients'])
+    Recipe.objects.filter(ingredients=instance).touch()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tags_version(sender, instance, **kwargs):
+    bump_version('tags')
+    bump_response_versions(['tags'])
+    Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif action == 'pre_clear':
+        Recipe.objects.filter(tags=instance).touch()
+    else:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_responses(sender, instance, created=False, **kwargs):
+    tags = () if created else instance.tags.values_list('slug', flat=True)
+    bump_response_versions(
+        recipe_version_names(instance.pk, instance.author_id, tags)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_responses_on_tags_change(sender, instance, action, reverse,
+                                        pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # Рецепты меняют через сериализатор, теги у рецептов
+        # со стороны тега — редкость: сбрасываются все ответы.
+        bump_response_versions(['tags'])
+        return
+    if action == 'pre_clear':
+        tags = instance.tags.all()
+    else:
+        tags = Tag.objects.filter(pk__in=pk_set)
+    bump_response_versions(recipe_version_names(
+        instance.pk, instance.author_id,
+        tags.values_list('slug', flat=True)
+    ))
+
+
+@receiver(post_save, sender=IngredientAmountInRecipe)
+@receiver(post_delete, sender=IngredientAmountInRecipe)
+def invalidate_responses_on_ingredients_change(sender, instance, **kwargs):
+    if recipe_deleting(instance.recipe_id):
+        return
+    rows = Recipe.objects.filter(pk=instance.recipe_id).values_list(
+        'author_id', 'tags__slug'
+    )
+    if rows:
+        bump_response_versions(recipe_version_names(
+            instance.recipe_id, rows[0][0],
+            [slug for _, slug in rows if slug]
+        ))
+
+
+@receiver(post_save, sender=IngredientAmountInRecipe)
+@receiver(post_delete, sender=IngredientAmountInRecipe)
+def touch_recipe_on_ingredients_change(sender, instance, created=True,
+                                       **kwargs):
+    # Флаг похожих рецептов ставится вместе со временем изменения:
+    # по нему build_similar_recipes оставляет флаг у рецептов,
+    # изменённых во время пересчёта.
+    if recipe_deleting(instance.recipe_id):
+        return
+    saved = getattr(instance, 'saved_amount', None)
+    changes = {'updated_at': timezone.now()}
+    if created or saved is None or saved[1] != instance.ingredient_id:
+        changes['similarity_stale'] = True
+    Recipe.objects.filter(pk=instance.recipe_id).update(**changes)
+
+
+@receiver(pre_save, sender=IngredientAmountInRecipe)
+def remember_saved_amount(sender, instance, **kwargs):
+    # Старые значения берутся из загруженных; из БД они читаются,
+    # только если строка загружена с отложенными полями.
+    fields = IngredientAmountInRecipe.SAVED_FIELDS
+    saved = None
+    if not instance._state.adding:
+        saved = getattr(instance, 'loaded_amount', None)
+        if saved is None:
+            saved = IngredientAmountInRecipe.objects.filter(
+                pk=instance.pk
+            ).values_list(*fields).first()
+    instance.saved_amount = saved
+    instance.loaded_amount = tuple(
+        getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=IngredientAmountInRecipe)
+def change_shopping_lists_on_save(sender, instance, **kwargs):
+    # Сериализатор пишет строки без сигналов и сам меняет списки
+    # покупок, поэтому здесь учитываются правки из админки.
+    old_amounts = {}
+    saved = getattr(instance, 'saved_amount', None)
+    if saved is not None:
+        recipe_id, ingredient_id, amount = saved
+        if recipe_id == instance.recipe_id:
+            old_amounts = {ingredient_id: amount}
+        else:
+            ShoppingListItem.objects.change_recipe(
+                recipe_id, {ingredient_id: amount}, {}
+            )
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id,
+        old_amounts,
+        {instance.ingredient_id: instance.amount},
+    )
+
+
+@receiver(post_delete, sender=IngredientAmountInRecipe)
+def change_shopping_lists_on_delete(sender, instance, **kwargs):
+    if recipe_deleting(instance.recipe_id):
+        return
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+    )
+
+
+@receiver(post_save, sender=IngredientAmountInRecipe)
+def increment_ingredients_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'ingredients_count', 1,
+        )
+
+
+@receiver(post_delete, sender=IngredientAmountInRecipe)
+def decrement_ingredients_count(sender, instance, **kwargs):
+    if recipe_deleting(instance.recipe_id):
+        return
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'ingredients_count', -1
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def mark_neighbours_similarity_stale(sender, instance, **kwargs):
+    Recipe.objects.filter(neighbours__neighbour=instance).update(
+        similarity_stale=True, updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    names = Recipe.objects.filter(author=instance).version_names()
+    if names:
+        bump_response_versions(names)
+        Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_delete, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def bump_recipe_membership_version(sender, instance, **kwargs):
+    bump_version(membership_version_name(instance.user_id))
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def bump_subscription_membership_version(sender, instance, **kwargs):
+    bump_version(membership_version_name(instance.subscriber_id))
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_derivatives(sender, instance, **kwargs):
+    if not instance.image or instance.has_fresh_derivatives:
+        return
+    schedule_derivatives(
+        instance.pk, instance.image.name, instance.image_derivatives
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def choose_fan_out(sender, instance, **kwargs):
+    if not instance._state.adding:
+        return
+    instance.feed_subscribers = subscribers_to_fan_out(instance.author_id)
+    instance.fanned_out = instance.feed_subscribers is not None
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created and instance.fanned_out:
+        fan_out(instance, instance.feed_subscribers)
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.subscriber_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def prune_timeline(sender, instance, **kwargs):
+    prune(instance.subscriber_id, instance.author_id)
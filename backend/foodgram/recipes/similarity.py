@@ -0,0 +1,72 @@
+import numpy as np
+from scipy import sparse
+
+METRICS = ('jaccard', 'cosine')
+
+
+def ingredient_matrix(pairs):
+    '''
+    Разреженная матрица рецепт × ингредиент из пар
+    (id рецепта, id ингредиента). Возвращает отсортированные
+    id рецептов (номера строк) и матрицу из нулей и единиц.
+    '''
+    pairs = np.fromiter(
+        (value for pair in pairs for value in pair), dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), len(ingredient_ids)),
+    )
+    return recipe_ids, matrix
+
+
+def rows_of(recipe_ids, ids):
+    '''
+    Номера строк матрицы для id рецептов.
+    Рецепты без ингредиентов в матрице отсутствуют и пропускаются.
+    '''
+    ids = np.array(sorted(ids), dtype=np.int64)
+    rows = np.searchsorted(recipe_ids, ids)
+    found = rows < len(recipe_ids)
+    found[found] = recipe_ids[rows[found]] == ids[found]
+    return rows[found]
+
+
+def similarities(matrix, rows, metric):
+    '''
+    Сходство рецептов rows со всеми рецептами: разреженная матрица
+    len(rows) × число рецептов. Пересечения считаются одним
+    произведением матриц, Жаккар и косинус — над его ненулями.
+    '''
+    sizes = np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel()
+    overlap = (matrix[rows] @ matrix.T).tocsr()
+    common = overlap.data.astype(np.float64)
+    left = sizes[np.repeat(rows, np.diff(overlap.indptr))]
+    right = sizes[overlap.indices]
+    if metric == 'jaccard':
+        scores = common / (left + right - common)
+    else:
+        scores = common / np.sqrt(left * right)
+    return sparse.csr_matrix(
+        (scores, overlap.indices, overlap.indptr), shape=overlap.shape
+    )
+
+
+def top_neighbours(scores, rows, count):
+    '''
+    Для каждой строки из rows — номера count самых похожих рецептов
+    и их сходство по убыванию, без самого рецепта.
+    '''
+    for position, row in enumerate(rows):
+        start, end = scores.indptr[position], scores.indptr[position + 1]
+        columns = scores.indices[start:end]
+        values = scores.data[start:end]
+        own = columns != row
+        columns, values = columns[own], values[own]
+        if len(values) > count:
+            best = np.argpartition(-values, count - 1)[:count]
+            columns, values = columns[best], values[best]
+        order = np.lexsort((columns, -values))
+        yield row, columns[order], values[order]
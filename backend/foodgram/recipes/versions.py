@@ -0,0 +1,103 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils import timezone
+
+from foodgram.metrics import record_cache
+
+VERSION_KEY = 'catalog-version:{}'
+RESPONSE_VERSION_KEY = 'response-version:{}'
+
+
+def bump_version(name):
+    '''
+    Помечает каталог изменённым после фиксации транзакции:
+    данные, загруженные по старому токену до фиксации,
+    не окажутся под новым.
+    '''
+    transaction.on_commit(lambda: new_version(name))
+
+
+def new_version(name):
+    '''
+    Выдаёт каталогу новый токен версии и время изменения.
+    '''
+    version = (uuid4().hex, timezone.now())
+    cache.set(VERSION_KEY.format(name), version, None)
+    return version
+
+
+def get_version(name):
+    '''
+    Текущая версия каталога: пара (токен, время изменения).
+    Если версия вытеснена из кэша, выдаётся новая, поэтому
+    устаревший токен никогда не совпадёт с актуальным.
+    '''
+    version = cache.get(VERSION_KEY.format(name))
+    record_cache('catalog-version', version is not None)
+    if version is None:
+        return new_version(name)
+    return version
+
+
+def membership_version_name(user_id):
+    '''
+    Имя версии избранного, корзины и подписок пользователя.
+    '''
+    return f'membership:{user_id}'
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_response_versions(names):
+    '''
+    Токены версий, от которых зависит закэшированный ответ.
+    Вытесненные версии создаются заново.
+    '''
+    cache = response_cache()
+    keys = [RESPONSE_VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_response_versions(names):
+    '''
+    Делает недоступными закэшированные ответы, зависящие от names.
+    Токены меняются после фиксации транзакции, иначе ответ
+    со старыми данными мог бы закэшироваться под новым токеном.
+    '''
+    versions = {
+        RESPONSE_VERSION_KEY.format(name): uuid4().hex for name in names
+    }
+    transaction.on_commit(lambda: response_cache().set_many(versions, None))
+
+
+def recipe_version_names(recipe_id, author_id, tag_slugs):
+    '''
+    Версии ответов, которые меняются вместе с рецептом: сам рецепт
+    и списки, где он может оказаться.
+    '''
+    return [
+        f'recipe:{recipe_id}',
+        *recipe_list_version_names(),
+        *recipe_list_version_names(author_id=author_id),
+        *recipe_list_version_names(tag_slugs=tag_slugs),
+    ]
+
+
+def recipe_list_version_names(author_id=None, tag_slugs=()):
+    '''
+    Версии списка рецептов с фильтрами по автору и тегам.
+    '''
+    names = [f'recipe-list:tag:{slug}' for slug in tag_slugs]
+    if author_id:
+        names.append(f'recipe-list:author:{author_id}')
+    return names or ['recipe-list']
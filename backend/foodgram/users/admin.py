@@ -12,9 +12,10 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'role',
+        'recipes_count',
     )
     search_fields = ('username', 'email', 'first_name', 'last_name',)
-    list_filter = ('username', 'email', 'role',)
+    list_filter = ('role',)
     empty_value_display = '-пусто-'
 
 
@@ -25,5 +26,8 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'subscriber',
         'author',
     )
-    search_fields = ('subscriber', 'author',)
+    list_select_related = ('subscriber', 'author',)
+    search_fields = ('subscriber__username', 'author__username',)
+    autocomplete_fields = ('subscriber', 'author',)
+    show_full_result_count = False
     empty_value_display = '-пусто-'
@@ -10,6 +10,7 @@ from foodgram.global_constants import (
     ROLE_LENGTH,
     PASSWORD_LENGTH,
 )
+from foodgram.mixins import UpdateOnlyFieldsMixin
 
 ROLE = (
     ('user', 'Пользователь'),
@@ -17,7 +18,7 @@ ROLE = (
 )
 
 
-class User(AbstractUser):
+class User(UpdateOnlyFieldsMixin, AbstractUser):
     '''
     Кастомная модель пользователя.
     '''
@@ -57,6 +58,13 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False,
+    )
+
+    update_only_fields = ('recipes_count',)
 
     class Meta:
         ordering = ['-date_joined', ]
@@ -65,7 +73,7 @@ class User(AbstractUser):
 
     @property
     def is_admin(self):
-        return self.role == User.ROLE[1][0]
+        return self.role == ROLE[1][0]
 
     def __str__(self) -> str:
         return self.username